@@ -0,0 +1,308 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import redirect, render
+
+from friendship.exceptions import AlreadyExistsError
+from friendship.export import EXPORT_FORMATS, EXPORT_KINDS, aexport_lines
+from friendship.models import Block, Follow, Friend, FriendshipRequest
+from friendship.views import (
+    _username_lookup,
+    get_friendship_context_object_list_name,
+    get_friendship_context_object_name,
+    user_model,
+)
+
+# Templates may call template tags or follow relations that query the
+# database, so they are rendered in a worker thread.
+_render = sync_to_async(render)
+
+
+async def _auser(request):
+    """Return the user of ``request`` without blocking the event loop"""
+    if hasattr(request, "auser"):
+        return await request.auser()
+
+    def load():
+        # Touching an attribute evaluates the lazy user in this thread
+        request.user.get_username()
+        return request.user
+
+    return await sync_to_async(load)()
+
+
+def login_required(view):
+    """Async counterpart of ``django.contrib.auth.decorators.login_required``"""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await _auser(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+async def _aget_or_404(qs, **kwargs):
+    try:
+        return await qs.aget(**kwargs)
+    except qs.model.DoesNotExist:
+        raise Http404(f"No {qs.model._meta.object_name} matches the given query.") from None
+
+
+async def _relationship_list(request, user, full, paged):
+    """Async version of ``friendship.views._relationship_list``"""
+    if not getattr(settings, "FRIENDSHIP_PAGINATE_VIEWS", False):
+        return await full(user), None
+    try:
+        return await paged(user, cursor=request.GET.get("cursor"))
+    except ValueError:
+        raise Http404("Invalid cursor") from None
+
+
+async def view_friends(request, username, template_name="friendship/friend/user_list.html"):
+    """View the friends of a user"""
+    user = await _aget_or_404(user_model.objects.all(), **_username_lookup(username))
+    friends, next_cursor = await _relationship_list(
+        request, user, Friend.objects.afriends, Friend.objects.afriends_page
+    )
+    return await _render(
+        request,
+        template_name,
+        {
+            get_friendship_context_object_name(): user,
+            "friendship_context_object_name": get_friendship_context_object_name(),
+            "friends": friends,
+            "next_cursor": next_cursor,
+        },
+    )
+
+
+@login_required
+async def friendship_add_friend(request, to_username, template_name="friendship/friend/add.html"):
+    """Create a FriendshipRequest"""
+    ctx = {"to_username": to_username}
+
+    if request.method == "POST":
+        to_user = await user_model.objects.aget(**_username_lookup(to_username))
+        from_user = await _auser(request)
+        try:
+            await Friend.objects.aadd_friend(from_user, to_user)
+        except AlreadyExistsError as e:
+            ctx["errors"] = [f"{e}"]
+        else:
+            return redirect("friendship_request_list")
+
+    return await _render(request, template_name, ctx)
+
+
+@login_required
+async def friendship_accept(request, friendship_request_id):
+    """Accept a friendship request"""
+    if request.method == "POST":
+        user = await _auser(request)
+        f_request = await _aget_or_404(FriendshipRequest.objects.filter(to_user=user), id=friendship_request_id)
+        await f_request.aaccept()
+        return redirect("friendship_view_friends", username=user.get_username())
+
+    return redirect("friendship_requests_detail", friendship_request_id=friendship_request_id)
+
+
+@login_required
+async def friendship_reject(request, friendship_request_id):
+    """Reject a friendship request"""
+    if request.method == "POST":
+        user = await _auser(request)
+        f_request = await _aget_or_404(FriendshipRequest.objects.filter(to_user=user), id=friendship_request_id)
+        await f_request.areject()
+        return redirect("friendship_request_list")
+
+    return redirect("friendship_requests_detail", friendship_request_id=friendship_request_id)
+
+
+@login_required
+async def friendship_cancel(request, friendship_request_id):
+    """Cancel a previously created friendship_request_id"""
+    if request.method == "POST":
+        user = await _auser(request)
+        f_request = await _aget_or_404(FriendshipRequest.objects.filter(from_user=user), id=friendship_request_id)
+        await f_request.acancel()
+        return redirect("friendship_request_list")
+
+    return redirect("friendship_requests_detail", friendship_request_id=friendship_request_id)
+
+
+@login_required
+async def friendship_request_list(request, template_name="friendship/friend/requests_list.html"):
+    """View unread and read friendship requests"""
+    friendship_requests = await Friend.objects.arequests(await _auser(request))
+    friendship_requests = [f_request async for f_request in friendship_requests]
+
+    return await _render(request, template_name, {"requests": friendship_requests})
+
+
+@login_required
+async def friendship_request_list_rejected(request, template_name="friendship/friend/requests_list.html"):
+    """View rejected friendship requests"""
+    qs = FriendshipRequest.objects.filter(rejected__isnull=False)
+    qs = Friend.objects._friendship_request_select_related(qs, "from_user", "to_user")
+    friendship_requests = [f_request async for f_request in qs]
+
+    return await _render(request, template_name, {"requests": friendship_requests})
+
+
+@login_required
+async def friendship_requests_detail(request, friendship_request_id, template_name="friendship/friend/request.html"):
+    """View a particular friendship request"""
+    qs = FriendshipRequest.objects.select_related("from_user", "to_user")
+    f_request = await _aget_or_404(qs, id=friendship_request_id)
+
+    return await _render(request, template_name, {"friendship_request": f_request})
+
+
+async def followers(request, username, template_name="friendship/follow/followers_list.html"):
+    """List this user's followers"""
+    user = await _aget_or_404(user_model.objects.all(), **_username_lookup(username))
+    followers, next_cursor = await _relationship_list(
+        request, user, Follow.objects.afollowers, Follow.objects.afollowers_page
+    )
+    return await _render(
+        request,
+        template_name,
+        {
+            get_friendship_context_object_name(): user,
+            "friendship_context_object_name": get_friendship_context_object_name(),
+            "followers": followers,
+            "next_cursor": next_cursor,
+        },
+    )
+
+
+async def following(request, username, template_name="friendship/follow/following_list.html"):
+    """List who this user follows"""
+    user = await _aget_or_404(user_model.objects.all(), **_username_lookup(username))
+    following, next_cursor = await _relationship_list(
+        request, user, Follow.objects.afollowing, Follow.objects.afollowing_page
+    )
+    return await _render(
+        request,
+        template_name,
+        {
+            get_friendship_context_object_name(): user,
+            "friendship_context_object_name": get_friendship_context_object_name(),
+            "following": following,
+            "next_cursor": next_cursor,
+        },
+    )
+
+
+@login_required
+async def follower_add(request, followee_username, template_name="friendship/follow/add.html"):
+    """Create a following relationship"""
+    ctx = {"followee_username": followee_username}
+
+    if request.method == "POST":
+        followee = await user_model.objects.aget(**_username_lookup(followee_username))
+        follower = await _auser(request)
+        try:
+            await Follow.objects.aadd_follower(follower, followee)
+        except AlreadyExistsError as e:
+            ctx["errors"] = [f"{e}"]
+        else:
+            return redirect("friendship_following", username=follower.get_username())
+
+    return await _render(request, template_name, ctx)
+
+
+@login_required
+async def follower_remove(request, followee_username, template_name="friendship/follow/remove.html"):
+    """Remove a following relationship"""
+    if request.method == "POST":
+        followee = await user_model.objects.aget(**_username_lookup(followee_username))
+        follower = await _auser(request)
+        await Follow.objects.aremove_follower(follower, followee)
+        return redirect("friendship_following", username=follower.get_username())
+
+    return await _render(request, template_name, {"followee_username": followee_username})
+
+
+async def all_users(request, template_name="friendship/user_actions.html"):
+    users = [user async for user in user_model.objects.all()]
+
+    return await _render(request, template_name, {get_friendship_context_object_list_name(): users})
+
+
+async def blocking(request, username, template_name="friendship/block/blockers_list.html"):
+    """List this user's followers"""
+    user = await _aget_or_404(user_model.objects.all(), **_username_lookup(username))
+    await Block.objects.ablocked(user)
+
+    return await _render(
+        request,
+        template_name,
+        {
+            get_friendship_context_object_name(): user,
+            "friendship_context_object_name": get_friendship_context_object_name(),
+        },
+    )
+
+
+async def blockers(request, username, template_name="friendship/block/blocking_list.html"):
+    """List who this user follows"""
+    user = await _aget_or_404(user_model.objects.all(), **_username_lookup(username))
+    await Block.objects.ablocking(user)
+
+    return await _render(
+        request,
+        template_name,
+        {
+            get_friendship_context_object_name(): user,
+            "friendship_context_object_name": get_friendship_context_object_name(),
+        },
+    )
+
+
+@login_required
+async def block_add(request, blocked_username, template_name="friendship/block/add.html"):
+    """Create a following relationship"""
+    ctx = {"blocked_username": blocked_username}
+
+    if request.method == "POST":
+        blocked = await user_model.objects.aget(**_username_lookup(blocked_username))
+        blocker = await _auser(request)
+        try:
+            await Block.objects.aadd_block(blocker, blocked)
+        except AlreadyExistsError as e:
+            ctx["errors"] = [f"{e}"]
+        else:
+            return redirect("friendship_blocking", username=blocker.get_username())
+
+    return await _render(request, template_name, ctx)
+
+
+@login_required
+async def block_remove(request, blocked_username, template_name="friendship/block/remove.html"):
+    """Remove a following relationship"""
+    if request.method == "POST":
+        blocked = await user_model.objects.aget(**_username_lookup(blocked_username))
+        blocker = await _auser(request)
+        await Block.objects.aremove_block(blocker, blocked)
+        return redirect("friendship_blocking", username=blocker.get_username())
+
+    return await _render(request, template_name, {"blocked_username": blocked_username})
+
+
+@login_required
+async def export_relationships(request, kind, format):
+    """Stream the logged-in user's friends, followers, following, blocks or
+    requests as CSV or JSON lines"""
+    if kind not in EXPORT_KINDS or format not in EXPORT_FORMATS:
+        raise Http404("No such export")
+    user = await _auser(request)
+    response = StreamingHttpResponse(aexport_lines(kind, user, format), content_type=EXPORT_FORMATS[format])
+    response["Content-Disposition"] = f'attachment; filename="{kind}.{format}"'
+    return response
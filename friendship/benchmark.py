@@ -0,0 +1,153 @@
+import random
+from collections import namedtuple
+from contextlib import nullcontext
+from statistics import mean, quantiles
+from time import perf_counter
+from uuid import uuid4
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from friendship import views
+from friendship.models import Block, Follow, Friend, FriendshipRequest
+from friendship.testing import capture_cache_calls
+
+BenchmarkResult = namedtuple(
+    "BenchmarkResult", ["name", "cache_state", "iterations", "mean_ms", "p95_ms", "queries", "cache_calls"]
+)
+
+
+def run_benchmarks(users=1000, degree=10, iterations=50, seed=0):
+    """
+    Seed a social graph and time the relationship managers and list views
+
+    ``users`` users are created with power-law distributed numbers of friends,
+    follows and blocks averaging ``degree`` per user. Each read is measured
+    against a cold cache (a fresh key prefix per iteration) and a warm one;
+    writes are measured once per iteration on fresh pairs, including the
+    ``on_commit`` callbacks they register. Returns a list of
+    ``BenchmarkResult`` with the mean and 95th percentile latency in
+    milliseconds and the mean number of SQL queries and cache calls per
+    iteration.
+
+    Everything runs in a transaction that is rolled back, under a throwaway
+    ``FRIENDSHIP_CACHE_KEY_PREFIX``, so neither the database nor existing
+    cache entries are touched. The callbacks a measured call registers with
+    ``transaction.on_commit()`` are run as part of it, as if it committed.
+    Run it against a development database.
+    """
+    rng = random.Random(seed)
+    results = []
+    with transaction.atomic(), override_settings(FRIENDSHIP_CACHE_KEY_PREFIX=f"friendship-bench:{uuid4().hex}:"):
+        members = _seed_graph(users, degree, rng)
+        sample = [rng.choice(members) for _ in range(iterations)]
+        others = [rng.choice(members) for _ in range(iterations)]
+        factory = RequestFactory()
+
+        def get(view, user, *args):
+            request = factory.get("/")
+            request.user = user
+            return view(request, *args)
+
+        reads = {
+            "friends": lambda i: list(Friend.objects.friends(sample[i])),
+            "followers": lambda i: list(Follow.objects.followers(sample[i])),
+            "are_friends": lambda i: Friend.objects.are_friends(sample[i], others[i]),
+            "is_blocked": lambda i: Block.objects.is_blocked(sample[i], others[i]),
+            "view_friends": lambda i: get(views.view_friends, sample[i], sample[i].get_username()),
+            "view_followers": lambda i: get(views.followers, sample[i], sample[i].get_username()),
+            "view_requests": lambda i: get(views.friendship_request_list, sample[i]),
+        }
+        for name, func in reads.items():
+            results.append(_measure(name, "cold", func, iterations, cold=True))
+            results.append(_measure(name, "warm", func, iterations))
+
+        strangers = _stranger_pairs(members, iterations * 2, rng)
+        requests = [
+            FriendshipRequest.objects.create(from_user=from_user, to_user=to_user)
+            for from_user, to_user in strangers[iterations:]
+        ]
+        writes = {
+            "add_friend": lambda i: Friend.objects.add_friend(*strangers[i]),
+            "accept": lambda i: requests[i].accept(),
+        }
+        for name, func in writes.items():
+            results.append(_measure(name, "-", func, iterations))
+
+        transaction.set_rollback(True)
+    return results
+
+
+def _seed_graph(users, degree, rng):
+    """Create the benchmark users and a power-law graph between them"""
+    user_model = get_user_model()
+    prefix = f"friendship-bench-{uuid4().hex[:8]}-"
+    user_model._default_manager.bulk_create(
+        [user_model(**{user_model.USERNAME_FIELD: f"{prefix}{i}"}) for i in range(users)]
+    )
+    members = list(user_model._default_manager.filter(**{f"{user_model.USERNAME_FIELD}__startswith": prefix}))
+    pks = [member.pk for member in members]
+
+    def edges(scale):
+        # Pareto(2) has mean 2 * xm, so the average out-degree is ``scale``
+        for pk in pks:
+            n = min(len(pks) - 1, int(rng.paretovariate(2) * scale / 2))
+            for target in rng.sample(pks, n + 1)[:n]:
+                if target != pk:
+                    yield pk, target
+
+    Friend.objects.import_friendships(list(edges(degree / 2)))
+    Follow.objects.add_followers_many(list(edges(degree)))
+    Block.objects.add_blocks_many(list(edges(degree / 20)))
+    return members
+
+
+def _stranger_pairs(members, n, rng):
+    """Return ``n`` distinct pairs of members with no friendship or request between them"""
+    pairs, seen = [], set()
+    while len(pairs) < n:
+        user1, user2 = rng.sample(members, 2)
+        key = frozenset((user1.pk, user2.pk))
+        if key in seen or Friend.objects.are_friends(user1, user2) or Friend.objects.request_exists(user1, user2):
+            continue
+        seen.add(key)
+        pairs.append((user1, user2))
+    return pairs
+
+
+def _measure(name, cache_state, func, iterations, cold=False):
+    timings, queries, calls = [], 0, 0
+    if cache_state == "warm":
+        for i in range(iterations):
+            func(i)
+    for i in range(iterations):
+        fresh = override_settings(FRIENDSHIP_CACHE_KEY_PREFIX=f"friendship-bench:{uuid4().hex}:")
+        with (
+            fresh if cold else nullcontext(),
+            CaptureQueriesContext(connection) as captured,
+            capture_cache_calls() as counted,
+        ):
+            start = perf_counter()
+            pending = len(connection.run_on_commit)
+            func(i)
+            _run_on_commit(pending)
+            timings.append((perf_counter() - start) * 1000)
+        queries += len(captured)
+        calls += len(counted)
+    p95 = quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+    return BenchmarkResult(name, cache_state, iterations, mean(timings), p95, queries / iterations, calls / iterations)
+
+
+def _run_on_commit(start):
+    """
+    Run the ``on_commit`` callbacks registered since ``connection.run_on_commit``
+    held ``start`` of them, including those they register, and drop them so
+    they neither run twice nor outlive the call that registered them
+    """
+    while len(connection.run_on_commit) > start:
+        callbacks = connection.run_on_commit[start:]
+        del connection.run_on_commit[start:]
+        for sids, callback, *robust in callbacks:
+            callback()
@@ -0,0 +1,222 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+
+from friendship import metrics
+
+# Keys busted while an invalidation buffer is open, mapped to the database
+# whose transaction they follow, or None outside of one.
+_pending = ContextVar("friendship_pending_invalidations", default=None)
+
+# Values read or written while a request cache is open, or None outside of one.
+_memo = ContextVar("friendship_request_cache", default=None)
+
+
+@contextmanager
+def invalidation_buffer():
+    """
+    Collect cache invalidations and flush them with a single ``delete_many``
+
+    While a buffer is open, busting a cache records its keys instead of
+    deleting them, and reads of a recorded key skip the cache so they never
+    see, or re-populate, stale data. The keys are deleted when the outermost
+    buffer exits, with one ``delete_many`` per database the busting writes
+    went to. If that happens inside a transaction they are deleted again once
+    it commits, so a concurrent reader cannot re-cache pre-commit rows. Nested
+    buffers join the outermost one.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+
+    keys = {}
+    token = _pending.set(keys)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+        by_db = {}
+        for key, using in keys.items():
+            by_db.setdefault(using, []).append(key)
+        for using, db_keys in by_db.items():
+            cache.delete_many(db_keys, using=using)
+
+
+@contextmanager
+def request_cache():
+    """
+    Memoize the friendship cache in process for the duration of the block
+
+    Values read from or written to the shared cache are kept in a dict, so
+    repeating a lookup within the block costs neither a round trip nor an
+    unpickle. Busting a key evicts it from the memo as well. Nested blocks
+    share the outermost memo, which is discarded when it exits.
+    """
+    if _memo.get() is not None:
+        yield
+        return
+
+    token = _memo.set({})
+    try:
+        yield
+    finally:
+        _memo.reset(token)
+
+
+class FriendshipCache:
+    """
+    The cache used by the ``friendship`` managers
+
+    Stored in the ``FRIENDSHIP_CACHE_ALIAS`` cache, ``default`` unless set. A
+    thin wrapper over Django's cache API that honours any open
+    ``invalidation_buffer``. A ``None`` key is never cached: reads miss and
+    writes are dropped. Inside ``request_cache()`` reads are answered from
+    the in-process memo when possible. The ``a``-prefixed methods are the
+    async counterparts used by the async manager API.
+    """
+
+    @property
+    def backend(self):
+        return caches[getattr(settings, "FRIENDSHIP_CACHE_ALIAS", DEFAULT_CACHE_ALIAS)]
+
+    def _skip(self, key):
+        return key is None or key in (_pending.get() or ())
+
+    def _remember(self, data):
+        memo = _memo.get()
+        if memo is not None:
+            memo.update(data)
+
+    def _forget(self, keys):
+        memo = _memo.get()
+        if memo is not None:
+            for key in keys:
+                memo.pop(key, None)
+
+    def get(self, key, default=None):
+        if self._skip(key):
+            return default
+        memo = _memo.get()
+        if memo is not None and key in memo:
+            return memo[key]
+        value = self.backend.get(key)
+        if value is None:
+            return default
+        self._remember({key: value})
+        return value
+
+    def get_many(self, keys):
+        keys = [key for key in keys if not self._skip(key)]
+        memo = _memo.get() or {}
+        found = {key: memo[key] for key in keys if key in memo}
+        keys = [key for key in keys if key not in found]
+        if keys:
+            fetched = self.backend.get_many(keys)
+            self._remember(fetched)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        if not self._skip(key):
+            self.backend.set(key, value, timeout)
+            self._remember({key: value})
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT):
+        data = {key: value for key, value in data.items() if not self._skip(key)}
+        if data:
+            self.backend.set_many(data, timeout)
+            self._remember(data)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT):
+        if self._skip(key):
+            return False
+        added = self.backend.add(key, value, timeout)
+        if added:
+            self._remember({key: value})
+        return added
+
+    async def aget(self, key, default=None):
+        if self._skip(key):
+            return default
+        memo = _memo.get()
+        if memo is not None and key in memo:
+            return memo[key]
+        value = await self.backend.aget(key)
+        if value is None:
+            return default
+        self._remember({key: value})
+        return value
+
+    async def aget_many(self, keys):
+        keys = [key for key in keys if not self._skip(key)]
+        memo = _memo.get() or {}
+        found = {key: memo[key] for key in keys if key in memo}
+        keys = [key for key in keys if key not in found]
+        if keys:
+            fetched = await self.backend.aget_many(keys)
+            self._remember(fetched)
+            found.update(fetched)
+        return found
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT):
+        if not self._skip(key):
+            await self.backend.aset(key, value, timeout)
+            self._remember({key: value})
+
+    async def aset_many(self, data, timeout=DEFAULT_TIMEOUT):
+        data = {key: value for key, value in data.items() if not self._skip(key)}
+        if data:
+            await self.backend.aset_many(data, timeout)
+            self._remember(data)
+
+    async def aadd(self, key, value, timeout=DEFAULT_TIMEOUT):
+        if self._skip(key):
+            return False
+        added = await self.backend.aadd(key, value, timeout)
+        if added:
+            self._remember({key: value})
+        return added
+
+    async def adelete(self, key):
+        self._forget([key])
+        return await self.backend.adelete(key)
+
+    def incr(self, key, delta=1):
+        self._forget([key])
+        return self.backend.incr(key, delta)
+
+    def delete(self, key):
+        self._forget([key])
+        return self.backend.delete(key)
+
+    def delete_many(self, keys, using=None, once=()):
+        """
+        Delete ``keys``, or record them in the open ``invalidation_buffer``
+
+        Outside a buffer but inside a transaction on the ``using`` database
+        (the default database unless given), the keys are deleted now and
+        again when that transaction commits, except for those also in
+        ``once``.
+        """
+        keys = list(keys)
+        self._forget(keys)
+        pending = _pending.get()
+        if pending is not None:
+            pending.update(dict.fromkeys(keys, using))
+            return
+
+        if not keys:
+            return
+        metrics.cache_bust(keys)
+        self.backend.delete_many(keys)
+        repeat = [key for key in keys if key not in once]
+        if repeat and transaction.get_connection(using).in_atomic_block:
+            transaction.on_commit(partial(self.backend.delete_many, repeat), using=using)
+
+
+cache = FriendshipCache()
@@ -0,0 +1,138 @@
+import csv
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from friendship.models import Block, Follow, Friend, FriendshipRequest, _undirected_friends
+
+EXPORT_KINDS = ["friends", "followers", "following", "blocking", "requests"]
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+# Spreadsheets evaluate a cell starting with one of these as a formula
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def export_querysets(kind, user):
+    """
+    Return the column names and the ``values_list`` querysets of the export
+    ``kind`` of ``user``
+
+    ``kind`` is one of ``EXPORT_KINDS``. Only relationships ``user`` owns are
+    exported: the users ``user`` blocks, but not who blocks them, and the
+    requests they sent or received.
+    """
+    username = get_user_model().USERNAME_FIELD
+    columns = ["user_id", "username", "created"]
+    if kind == "friends":
+        querysets = [
+            Friend.objects.filter(to_user=user).values_list("from_user_id", f"from_user__{username}", "created")
+        ]
+        if _undirected_friends():
+            querysets.append(
+                Friend.objects.filter(from_user=user).values_list("to_user_id", f"to_user__{username}", "created")
+            )
+    elif kind == "followers":
+        querysets = [
+            Follow.objects.filter(followee=user).values_list("follower_id", f"follower__{username}", "created")
+        ]
+    elif kind == "following":
+        querysets = [
+            Follow.objects.filter(follower=user).values_list("followee_id", f"followee__{username}", "created")
+        ]
+    elif kind == "blocking":
+        querysets = [Block.objects.filter(blocker=user).values_list("blocked_id", f"blocked__{username}", "created")]
+    elif kind == "requests":
+        columns = [
+            "id",
+            "from_user_id",
+            "from_username",
+            "to_user_id",
+            "to_username",
+            "message",
+            "created",
+            "viewed",
+            "rejected",
+        ]
+        querysets = [
+            FriendshipRequest.objects.filter(Q(from_user=user) | Q(to_user=user)).values_list(
+                "pk",
+                "from_user_id",
+                f"from_user__{username}",
+                "to_user_id",
+                f"to_user__{username}",
+                "message",
+                "created",
+                "viewed",
+                "rejected",
+            )
+        ]
+    else:
+        raise ValueError(f"No export named {kind!r}")
+    return columns, [qs.order_by("created", "pk") for qs in querysets]
+
+
+def export_lines(kind, user, format="csv", chunk_size=2000):
+    """
+    Yield the export ``kind`` of ``user`` line by line, as CSV with a header
+    row or as JSON lines
+
+    Rows are streamed with ``values_list(...).iterator(chunk_size)``, so no
+    model instance is built and memory use does not grow with the number of
+    rows. Pass the generator to a ``StreamingHttpResponse``. CSV cells that
+    a spreadsheet would evaluate as a formula are prefixed with ``'``.
+    """
+    columns, querysets = export_querysets(kind, user)
+    line = _formatter(columns, format)
+    if format == "csv":
+        yield line(columns)
+    for qs in querysets:
+        for row in qs.iterator(chunk_size=chunk_size):
+            yield line(row)
+
+
+async def aexport_lines(kind, user, format="csv", chunk_size=2000):
+    """
+    Async version of ``export_lines``, for ``StreamingHttpResponse`` under ASGI
+    """
+    columns, querysets = export_querysets(kind, user)
+    line = _formatter(columns, format)
+    if format == "csv":
+        yield line(columns)
+    for qs in querysets:
+        # QuerySet.aiterator() runs the first query of a values_list() in the
+        # event loop, so chunks are pulled from the sync iterator in a thread.
+        rows = qs.iterator(chunk_size=chunk_size)
+        next_chunk = sync_to_async(lambda rows=rows: list(islice(rows, chunk_size)))
+        while chunk := await next_chunk():
+            for row in chunk:
+                yield line(row)
+
+
+class _Echo:
+    """A file-like object whose ``write`` returns what it is given"""
+
+    def write(self, value):
+        return value
+
+
+def _formatter(columns, format):
+    if format == "csv":
+        writerow = csv.writer(_Echo()).writerow
+        return lambda row: writerow([_escape_formula(value) for value in row])
+    if format == "jsonl":
+        encoder = DjangoJSONEncoder()
+        return lambda row: encoder.encode(dict(zip(columns, row))) + "\n"
+    raise ValueError(f"No export format {format!r}")
+
+
+def _escape_formula(value):
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
@@ -0,0 +1,31 @@
+import json as _json
+
+from django.core.management.base import BaseCommand
+
+from friendship.benchmark import run_benchmarks
+
+
+class Command(BaseCommand):
+    help = "Benchmark the relationship managers and views on a generated graph, rolled back afterwards"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="Users in the generated graph (default 1000)")
+        parser.add_argument("--degree", type=int, default=10, help="Average relationships per user (default 10)")
+        parser.add_argument("--iterations", type=int, default=50, help="Calls measured per benchmark (default 50)")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed of the generated graph (default 0)")
+        parser.add_argument("--json", action="store_true", help="Print one JSON object per benchmark")
+
+    def handle(self, *args, users, degree, iterations, seed, json, **options):
+        results = run_benchmarks(users, degree, iterations, seed)
+        if json:
+            for result in results:
+                self.stdout.write(_json.dumps(result._asdict()))
+            return
+
+        self.stdout.write(
+            f"{'benchmark':<16}{'cache':<7}{'mean ms':>10}{'p95 ms':>10}{'queries':>10}{'cache calls':>13}"
+        )
+        for r in results:
+            self.stdout.write(
+                f"{r.name:<16}{r.cache_state:<7}{r.mean_ms:>10.3f}{r.p95_ms:>10.3f}{r.queries:>10.1f}{r.cache_calls:>13.1f}"
+            )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from friendship.models import Friend
+from friendship.storage import convert_to_mirrored, convert_to_undirected
+
+
+class Command(BaseCommand):
+    help = "Convert Friend rows between mirrored pairs and one undirected row per friendship"
+
+    def add_arguments(self, parser):
+        parser.add_argument("storage", choices=["undirected", "mirrored"], help="Storage to convert to")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows written per query (default 1000)")
+
+    def handle(self, *args, storage, batch_size, **options):
+        if storage == "undirected":
+            deleted, flipped = convert_to_undirected(Friend, batch_size)
+            self.stdout.write(f"Deleted {deleted} mirrored rows and flipped {flipped} rows")
+        else:
+            inserted = convert_to_mirrored(Friend, batch_size)
+            self.stdout.write(f"Inserted {inserted} mirrored rows")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from friendship.snapshot import import_snapshot
+
+
+class Command(BaseCommand):
+    help = "Bulk-import a snapshot written by export_friendship_graph"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Snapshot directory")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Edges inserted per batch (default 1000)")
+
+    def handle(self, *args, path, batch_size, **options):
+        try:
+            created = import_snapshot(path, batch_size)
+        except (OSError, ValueError, DatabaseError) as e:
+            raise CommandError(e) from e
+
+        for name, count in created.items():
+            self.stdout.write(f"Imported {count} {name} rows")
@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from friendship.models import Friend
+
+
+class Command(BaseCommand):
+    help = "Precompute and cache the friend suggestions of every user, or of the given users"
+
+    def add_arguments(self, parser):
+        parser.add_argument("user_pks", nargs="*", help="Only refresh the users with these primary keys")
+        parser.add_argument("--batch-size", type=int, default=500, help="Users processed per batch (default 500)")
+
+    def handle(self, *args, user_pks, batch_size, **options):
+        user_model = get_user_model()
+        if user_pks:
+            user_pks = [user_model._meta.pk.to_python(pk) for pk in user_pks]
+        else:
+            user_pks = user_model._default_manager.order_by("pk").values_list("pk", flat=True).iterator()
+
+        refreshed, batch = 0, []
+        for pk in user_pks:
+            batch.append(pk)
+            if len(batch) == batch_size:
+                refreshed += Friend.objects.refresh_suggestions(batch, batch_size)
+                batch = []
+        if batch:
+            refreshed += Friend.objects.refresh_suggestions(batch, batch_size)
+
+        self.stdout.write(f"Refreshed suggestions for {refreshed} users")
@@ -0,0 +1,179 @@
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+# The resolved FRIENDSHIP_METRICS callable, None when metrics are off, or
+# _UNRESOLVED until the first measurement.
+_UNRESOLVED = object()
+_hook = _UNRESOLVED
+
+# Whether a timed method is running, so the methods it calls are not reported
+_timing = ContextVar("friendship_metrics_timing", default=False)
+
+
+def emit(name, value, **tags):
+    """
+    Report one measurement to the ``FRIENDSHIP_METRICS`` callable, if any
+
+    The callable is called as ``hook(name, value, tags)``. The names emitted
+    by ``friendship`` are:
+
+    * ``friendship.latency``: seconds spent in a public API method, tagged
+      with ``method`` (e.g. ``"FriendshipManager.friends"``). Methods called
+      by another public method are part of its latency and not reported
+    * ``friendship.cache.hit`` / ``friendship.cache.miss``: one per cached
+      value looked up, tagged with ``cache_type`` (a key of ``CACHE_TYPES``)
+    * ``friendship.cache.bust``: number of keys of a ``cache_type`` deleted
+    * ``friendship.rows``: model instances materialized by a lazy list,
+      tagged with ``model``
+    """
+    hook = _get_hook()
+    if hook is not None:
+        hook(name, value, tags)
+
+
+class MetricsCollector:
+    """
+    A ``FRIENDSHIP_METRICS`` callable that keeps every measurement in memory
+
+    Meant for tests::
+
+        collector = MetricsCollector()
+        with override_settings(FRIENDSHIP_METRICS=collector):
+            Friend.objects.friends(user)
+        collector.total("friendship.cache.miss", cache_type="friends")
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, name, value, tags):
+        self.events.append((name, value, tags))
+
+    def total(self, name, **tags):
+        """Return the sum of the values of ``name`` whose tags include ``tags``"""
+        return sum(
+            value
+            for event, value, event_tags in self.events
+            if event == name and all(event_tags.get(k) == v for k, v in tags.items())
+        )
+
+    def clear(self):
+        self.events.clear()
+
+
+def instrument(cls, names=None):
+    """
+    Report the latency of the methods ``names`` of ``cls``, every public
+    method defined on it by default
+
+    Each method is wrapped once. While ``FRIENDSHIP_METRICS`` is unset the
+    wrapper only checks for it before calling the method.
+    """
+    if names is None:
+        names = [name for name, attr in vars(cls).items() if callable(attr) and not name.startswith("_")]
+    for name in names:
+        setattr(cls, name, _timed(f"{cls.__name__}.{name}", vars(cls)[name]))
+
+
+def _timed(method, func):
+    if iscoroutinefunction(func):
+
+        @wraps(func)
+        async def atimed(*args, **kwargs):
+            if _timing.get() or _get_hook() is None:
+                return await func(*args, **kwargs)
+            token = _timing.set(True)
+            start = perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _timing.reset(token)
+                emit("friendship.latency", perf_counter() - start, method=method)
+
+        return atimed
+
+    @wraps(func)
+    def timed(*args, **kwargs):
+        if _timing.get() or _get_hook() is None:
+            return func(*args, **kwargs)
+        token = _timing.set(True)
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _timing.reset(token)
+            emit("friendship.latency", perf_counter() - start, method=method)
+
+    return timed
+
+
+def cache_lookup(key, hit):
+    """Emit the hit or miss of one lookup of the cached value at ``key``"""
+    if _get_hook() is not None:
+        type = _cache_type(key)
+        if type is not None:
+            emit("friendship.cache.hit" if hit else "friendship.cache.miss", 1, cache_type=type)
+
+
+def cache_bust(keys):
+    """Emit the number of ``keys`` deleted by cache type"""
+    if _get_hook() is None:
+        return
+    busts = {}
+    for key in keys:
+        type = _cache_type(key, generations=True)
+        if type is not None:
+            busts[type] = busts.get(type, 0) + 1
+    for type, n in busts.items():
+        emit("friendship.cache.bust", n, cache_type=type)
+
+
+def _cache_type(key, generations=False):
+    """
+    Return the ``CACHE_TYPES`` entry ``key`` was built from
+
+    A versioning generation key maps to its ``BUST_CACHES`` namespace when
+    ``generations`` is true and to ``None`` otherwise, as do locks and keys
+    that are not ours.
+    """
+    from friendship.models import CACHE_TYPES
+
+    prefix = getattr(settings, "FRIENDSHIP_CACHE_KEY_PREFIX", "")
+    if key is None or not key.startswith(prefix) or key.endswith(":lock"):
+        return None
+    key = key[len(prefix) :]
+    code, _, rest = key.partition("-")
+    if code == "fv":
+        return rest.rpartition("-")[0] if generations else None
+    for type, pattern in CACHE_TYPES.items():
+        if pattern.partition("-")[0] == code:
+            return type
+    return None
+
+
+def _get_hook():
+    """
+    Return the ``FRIENDSHIP_METRICS`` callable, importing it on first use
+
+    Resolving it lazily lets a dotted path point at a module that imports
+    ``friendship`` itself.
+    """
+    global _hook
+    if _hook is _UNRESOLVED:
+        hook = getattr(settings, "FRIENDSHIP_METRICS", None)
+        _hook = import_string(hook) if isinstance(hook, str) else hook
+    return _hook
+
+
+@receiver(setting_changed)
+def _setting_changed(setting, **kwargs):
+    global _hook
+    if setting == "FRIENDSHIP_METRICS":
+        _hook = _UNRESOLVED
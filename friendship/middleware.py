@@ -0,0 +1,79 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from friendship.cache import invalidation_buffer, request_cache
+
+
+class InvalidationBufferMiddleware:
+    """
+    Coalesce every cache invalidation made while handling a request into a
+    single ``delete_many`` at the end of the request
+
+    The body of a streaming response is generated after the view returns, so
+    it gets an invalidation buffer of its own, flushed once the body is
+    exhausted or closed.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with invalidation_buffer():
+            response = self.get_response(request)
+        return _buffer_streaming_content(response)
+
+    async def __acall__(self, request):
+        with invalidation_buffer():
+            response = await self.get_response(request)
+        return _buffer_streaming_content(response)
+
+
+def _buffer_streaming_content(response):
+    if response.streaming:
+        if response.is_async:
+            response.streaming_content = _abuffered(response.streaming_content)
+        else:
+            response.streaming_content = _buffered(response.streaming_content)
+    return response
+
+
+def _buffered(content):
+    with invalidation_buffer():
+        yield from content
+
+
+async def _abuffered(content):
+    with invalidation_buffer():
+        async for chunk in content:
+            yield chunk
+
+
+class RequestCacheMiddleware:
+    """
+    Memoize friendship cache lookups in process for the duration of each
+    request
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with request_cache():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with request_cache():
+            return await self.get_response(request)
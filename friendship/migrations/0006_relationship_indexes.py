@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("friendship", "0005_auto_20211005_1716"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="block",
+            index=models.Index(fields=["blocked", "blocker"], name="block_blocked_blocker_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="follow",
+            index=models.Index(fields=["followee", "follower"], name="follow_followee_follower_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="follow",
+            index=models.Index(fields=["followee", "created", "id"], name="follow_followee_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="follow",
+            index=models.Index(fields=["follower", "created", "id"], name="follow_follower_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="friend",
+            index=models.Index(fields=["to_user", "from_user"], name="friend_to_user_from_user_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="friend",
+            index=models.Index(fields=["to_user", "created", "id"], name="friend_to_user_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="friendshiprequest",
+            index=models.Index(fields=["to_user", "id"], name="request_to_user_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="friendshiprequest",
+            index=models.Index(fields=["to_user", "rejected", "from_user"], name="request_to_user_rejected_idx"),
+        ),
+    ]
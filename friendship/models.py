@@ -1,63 +1,90 @@
+import asyncio
+from abc import ABC, abstractmethod
+from array import array
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from bisect import bisect_left
+from collections import Counter, namedtuple
+from collections.abc import Sequence
+from datetime import datetime
+from functools import partial
+from time import monotonic, sleep, time_ns
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, router, transaction
+from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from friendship import metrics
+from friendship.cache import cache
 from friendship.exceptions import AlreadyExistsError, AlreadyFriendsError, MaxFriendsExceededError
 from friendship.signals import (
     block_created,
     block_removed,
+    blocks_created,
     followee_created,
     followee_removed,
     follower_created,
     follower_removed,
     following_created,
     following_removed,
+    followings_created,
     friendship_removed,
     friendship_request_accepted,
     friendship_request_canceled,
     friendship_request_created,
     friendship_request_rejected,
     friendship_request_viewed,
+    friendships_imported,
 )
 
 AUTH_USER_MODEL = getattr(settings, "AUTH_USER_MODEL", "auth.User")
 
 CACHE_TYPES = {
     "friends": "f-%s",
+    "friends_page": "fp-%s",
+    "friends_of_friends": "fof-%s",
     "followers": "fo-%s",
+    "followers_page": "fop-%s",
     "following": "fl-%s",
+    "following_page": "flp-%s",
     "blocks": "b-%s",
     "blocked": "bo-%s",
     "blocking": "bd-%s",
     "requests": "fr-%s",
     "sent_requests": "sfr-%s",
-    "unread_requests": "fru-%s",
-    "unread_request_count": "fruc-%s",
-    "read_requests": "frr-%s",
-    "rejected_requests": "frj-%s",
-    "unrejected_requests": "frur-%s",
-    "unrejected_request_count": "frurc-%s",
+    "friend_count": "fc-%s",
+    "follower_count": "foc-%s",
+    "following_count": "flc-%s",
+    "blocked_count": "boc-%s",
+    "blocking_count": "bdc-%s",
+    "suggestions": "sg-%s",
 }
 
+# Counters are kept up to date with incr/decr rather than busted, so they are
+# deliberately absent from BUST_CACHES.
+COUNT_TYPES = {
+    "friends": "friend_count",
+    "followers": "follower_count",
+    "following": "following_count",
+    "blocked": "blocked_count",
+    "blocking": "blocking_count",
+}
+
+# Suggestions are recomputed once a relationship change commits rather than
+# busted (see _refresh_suggestions_on_commit), so they are absent too.
 BUST_CACHES = {
-    "friends": ["friends"],
-    "followers": ["followers"],
+    "friends": ["friends", "friends_page", "friends_of_friends"],
+    "followers": ["followers", "followers_page"],
     "blocks": ["blocks"],
-    "blocked": ["blocked"],
-    "following": ["following"],
-    "blocking": ["blocking"],
-    "requests": [
-        "requests",
-        "unread_requests",
-        "unread_request_count",
-        "read_requests",
-        "rejected_requests",
-        "unrejected_requests",
-        "unrejected_request_count",
-    ],
+    "blocked": ["blocked", "blocks"],
+    "following": ["following", "following_page"],
+    "blocking": ["blocking", "blocks"],
+    "requests": ["requests"],
     "sent_requests": ["sent_requests"],
 }
 
@@ -66,16 +93,1103 @@ def cache_key(type, user_pk):
     """
     Build the cache key for a particular type of cached value
     """
-    return CACHE_TYPES[type] % user_pk
+    return cache_keys([(type, user_pk)])[0]
+
+
+async def acache_key(type, user_pk):
+    """
+    Async version of ``cache_key``
+    """
+    return (await acache_keys([(type, user_pk)]))[0]
+
+
+def cache_timeout(type):
+    """
+    Return the timeout to cache values of ``type`` with
+
+    Looked up in ``FRIENDSHIP_CACHE_TIMEOUTS`` by type, falling back to
+    ``FRIENDSHIP_CACHE_TIMEOUT`` and then to the cache backend's default.
+    """
+    timeouts = getattr(settings, "FRIENDSHIP_CACHE_TIMEOUTS", {})
+    if type in timeouts:
+        return timeouts[type]
+    return getattr(settings, "FRIENDSHIP_CACHE_TIMEOUT", DEFAULT_TIMEOUT)
+
+
+def _base_key(type, user_pk):
+    return getattr(settings, "FRIENDSHIP_CACHE_KEY_PREFIX", "") + CACHE_TYPES[type] % user_pk
+
+
+def cache_keys(entries):
+    """
+    Build the cache keys for several ``(type, user_pk)`` pairs
+
+    With ``FRIENDSHIP_CACHE_VERSIONING`` enabled each key embeds the current
+    generation of every ``BUST_CACHES`` namespace it belongs to, fetched with
+    a single ``get_many``. A key is ``None`` (never cached) while one of its
+    generations has a pending invalidation.
+    """
+    entries = list(entries)
+    if not getattr(settings, "FRIENDSHIP_CACHE_VERSIONING", False):
+        return [_base_key(type, user_pk) for type, user_pk in entries]
+
+    generation_keys = _generation_keys(entries)
+    generations = cache.get_many(generation_keys)
+    for key in generation_keys - generations.keys():
+        # Start a namespace at the current time rather than 0 so an evicted
+        # generation can never resurrect keys cached under its old value.
+        generation = time_ns()
+        if cache.add(key, generation):
+            generations[key] = generation
+    return _versioned_keys(entries, generations)
+
+
+async def acache_keys(entries):
+    """
+    Async version of ``cache_keys``
+    """
+    entries = list(entries)
+    if not getattr(settings, "FRIENDSHIP_CACHE_VERSIONING", False):
+        return [_base_key(type, user_pk) for type, user_pk in entries]
+
+    generation_keys = _generation_keys(entries)
+    generations = await cache.aget_many(generation_keys)
+    for key in generation_keys - generations.keys():
+        generation = time_ns()
+        if await cache.aadd(key, generation):
+            generations[key] = generation
+    return _versioned_keys(entries, generations)
+
+
+def _namespaces(type):
+    return [namespace for namespace, types in BUST_CACHES.items() if type in types]
+
+
+def _generation_keys(entries):
+    return {_generation_key(ns, user_pk) for type, user_pk in entries for ns in _namespaces(type)}
+
+
+def _versioned_keys(entries, generations):
+    keys = []
+    for type, user_pk in entries:
+        parts = [generations.get(_generation_key(ns, user_pk)) for ns in _namespaces(type)]
+        if None in parts:
+            keys.append(None)
+        else:
+            keys.append(".".join([_base_key(type, user_pk), *map(str, parts)]))
+    return keys
+
+
+def _generation_key(namespace, user_pk):
+    return f"{getattr(settings, 'FRIENDSHIP_CACHE_KEY_PREFIX', '')}fv-{namespace}-{user_pk}"
 
 
 def bust_cache(type, user_pk):
     """
     Bust our cache for a given type, can bust multiple caches
     """
-    bust_keys = BUST_CACHES[type]
-    keys = [CACHE_TYPES[k] % user_pk for k in bust_keys]
-    cache.delete_many(keys)
+    bust_caches([(type, user_pk)])
+
+
+def bust_caches(entries):
+    """
+    Bust the caches for several ``(type, user_pk)`` pairs with a single
+    ``delete_many`` per database the busting models are written to, whose
+    transaction decides when the deletes are repeated
+
+    Inside ``friendship.cache.invalidation_buffer()`` the keys are collected
+    and deleted when the buffer exits instead. With
+    ``FRIENDSHIP_CACHE_VERSIONING`` enabled only each namespace's generation
+    key is deleted, which orphans every key derived from it at once.
+
+    The counter of each id set is deleted in the same ``delete_many``, so reads
+    inside the writing transaction count the rows they see. It is not deleted
+    again on commit, where ``_adjust_counts`` takes over.
+    """
+    versioned = getattr(settings, "FRIENDSHIP_CACHE_VERSIONING", False)
+    keys = {}
+    counters = set()
+    for type, user_pk in entries:
+        db_keys = keys.setdefault(router.db_for_write(_source_model(type)), set())
+        if versioned:
+            db_keys.add(_generation_key(type, user_pk))
+        else:
+            db_keys.update(_base_key(k, user_pk) for k in BUST_CACHES[type])
+        if type in COUNT_TYPES:
+            counter = _base_key(COUNT_TYPES[type], user_pk)
+            counters.add(counter)
+            db_keys.add(counter)
+    for using, db_keys in keys.items():
+        cache.delete_many(db_keys, using=using, once=counters)
+
+
+def _source_model(type):
+    """
+    Return the model the ``BUST_CACHES`` namespace ``type`` is derived from
+    """
+    if type == "friends":
+        return Friend
+    if type in ("followers", "following"):
+        return Follow
+    if type in ("blocks", "blocked", "blocking"):
+        return Block
+    return FriendshipRequest
+
+
+def _cached_count(type, user):
+    """
+    Return the number of users in the id set ``type``, from its cached counter
+    when present and with a ``COUNT(*)`` otherwise
+    """
+    key = cache_key(COUNT_TYPES[type], user.pk)
+    count = cache.get(key)
+    metrics.cache_lookup(key, count is not None)
+
+    if count is None:
+        count = _relation_ids_qs(type, user).count()
+        if not _count_pending(type, key):
+            cache.add(key, count, cache_timeout(COUNT_TYPES[type]))
+
+    return count
+
+
+async def _acached_count(type, user):
+    """
+    Async version of ``_cached_count``
+    """
+    key = await acache_key(COUNT_TYPES[type], user.pk)
+    count = await cache.aget(key)
+    metrics.cache_lookup(key, count is not None)
+
+    if count is None:
+        count = await _relation_ids_qs(type, user).acount()
+        if not _count_pending(type, key):
+            await cache.aadd(key, count, cache_timeout(COUNT_TYPES[type]))
+
+    return count
+
+
+def _count_pending(type, key):
+    """
+    Whether the current transaction has yet to commit an adjustment of the
+    counter ``key``, which a count read inside it already includes
+    """
+    connection = transaction.get_connection(router.db_for_write(_source_model(type)))
+    return any(
+        getattr(func, "func", None) is _apply_counts and key in func.args[0]
+        for sids, func, *robust in connection.run_on_commit
+    )
+
+
+def _adjust_counts(entries):
+    """
+    Apply ``(type, user_pk, delta)`` changes to the cached counters once the
+    current transaction commits
+
+    The write has already deleted the counters with ``bust_caches``, so that
+    reads inside its transaction count the new rows, without caching them
+    (see ``_count_pending``). On commit, a counter a concurrent reader cached
+    from the committed rows in the meantime is brought up to date with the
+    cache's atomic ``incr``, so concurrent writers don't lose updates, and
+    nothing is applied if the transaction rolls back. A counter that is not
+    cached is deleted instead; it is counted from the database the next time
+    it is read.
+    """
+    deltas = {}
+    for type, user_pk, delta in entries:
+        using = router.db_for_write(_source_model(type))
+        key = cache_key(COUNT_TYPES[type], user_pk)
+        deltas.setdefault(using, {})
+        deltas[using][key] = deltas[using].get(key, 0) + delta
+    for using, counts in deltas.items():
+        transaction.on_commit(partial(_apply_counts, counts), using=using)
+
+
+def _apply_counts(deltas):
+    missing = []
+    for key, delta in deltas.items():
+        if delta:
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                missing.append(key)
+    if missing:
+        cache.delete_many(missing)
+
+
+def _bulk_create_pairs(model, first, second, pairs, batch_size=None):
+    """
+    Insert a ``model`` row for each ``(first, second)`` pair of users that does
+    not exist yet, returning the instances that were inserted
+
+    Users may be given as instances or primary keys. Every row is inserted
+    with ``ignore_conflicts``, so rows that already exist, including those
+    created concurrently, are skipped by the database. The rows this call
+    inserted are then told apart by the ``created`` timestamp they were all
+    given, with one query that also fills in their primary keys.
+    """
+    pairs = {(getattr(a, "pk", a), getattr(b, "pk", b)): (a, b) for a, b in pairs}
+    if not pairs:
+        return []
+    now = timezone.now()
+    objs = {key: model(**_user_field(first, a), **_user_field(second, b), created=now) for key, (a, b) in pairs.items()}
+    model.objects.bulk_create(objs.values(), batch_size=batch_size, ignore_conflicts=True)
+    inserted = model.objects.filter(created=now, **{f"{first}__in": {a for a, b in pairs}})
+    pks = {(a, b): pk for pk, a, b in inserted.values_list("pk", f"{first}_id", f"{second}_id")}
+    created = []
+    for key, obj in objs.items():
+        if key in pks:
+            obj.pk = pks[key]
+            obj._state.adding = False
+            created.append(obj)
+    return created
+
+
+def _user_field(name, user):
+    return {name: user} if isinstance(user, models.Model) else {f"{name}_id": user}
+
+
+RelationshipPage = namedtuple("RelationshipPage", ["users", "next_cursor"])
+
+
+def _pack_ids(ids, sort=True):
+    """
+    Pack primary keys into the compact value stored in the cache
+
+    Integer keys are stored as the raw bytes of an ``array("q")``, which is a
+    fraction of the size of a pickled list of model instances. Any other key
+    type (UUIDs, strings) falls back to a tuple. Keys are sorted unless
+    ``sort`` is false.
+    """
+    ids = sorted(ids) if sort else list(ids)
+    try:
+        return array("q", ids).tobytes()
+    except (TypeError, OverflowError):
+        return tuple(ids)
+
+
+def _unpack_ids(value):
+    """
+    Turn a value produced by ``_pack_ids`` back into a sequence of keys
+    """
+    if isinstance(value, bytes):
+        ids = array("q")
+        ids.frombytes(value)
+        return ids
+    return value
+
+
+def _contains(ids, pk):
+    """
+    Binary search the sorted ``ids`` for ``pk``
+    """
+    i = bisect_left(ids, pk)
+    return i < len(ids) and ids[i] == pk
+
+
+def _cached_contains(*lookups):
+    """
+    Answer a membership question from whichever cached id set is present
+
+    Each lookup is a ``(type, user_pk, member_pk)`` triple. All the keys are
+    fetched in a single round trip and the first one found in the cache is
+    authoritative. Returns ``None`` when none of them are cached.
+    """
+    keys = cache_keys((type, user_pk) for type, user_pk, member_pk in lookups)
+    return _answer_contains(lookups, keys, cache.get_many(keys))
+
+
+async def _acached_contains(*lookups):
+    """
+    Async version of ``_cached_contains``
+    """
+    keys = await acache_keys((type, user_pk) for type, user_pk, member_pk in lookups)
+    return _answer_contains(lookups, keys, await cache.aget_many(keys))
+
+
+def _answer_contains(lookups, keys, cached):
+    for key, (type, user_pk, member_pk) in zip(keys, lookups):
+        if key in cached:
+            metrics.cache_lookup(key, True)
+            return _contains(_unpack_ids(cached[key]), member_pk)
+    metrics.cache_lookup(keys[0], False)
+    return None
+
+
+def _undirected_friends():
+    return getattr(settings, "FRIENDSHIP_UNDIRECTED_STORAGE", False)
+
+
+def _friend_rows(user1, user2):
+    """
+    Return the unsaved ``Friend`` rows that store a friendship between two
+    users: one canonical row from the lower to the higher primary key with
+    ``FRIENDSHIP_UNDIRECTED_STORAGE``, a mirrored pair otherwise
+    """
+    if _undirected_friends():
+        user1, user2 = sorted((user1, user2), key=lambda user: user.pk)
+        return [Friend(from_user=user1, to_user=user2)]
+    return [Friend(from_user=user1, to_user=user2), Friend(from_user=user2, to_user=user1)]
+
+
+def _friendship_qs(user1, user2):
+    """
+    Return the queryset of the ``Friend`` row that proves two users are friends
+    """
+    if _undirected_friends():
+        user1, user2 = sorted((user1, user2), key=lambda user: user.pk)
+        return Friend.objects.filter(from_user=user1, to_user=user2)
+    return Friend.objects.filter(to_user=user1, from_user=user2)
+
+
+def _friend_edges(user_pks):
+    """
+    Return the set of ``(user_pk, friend_pk)`` pairs for the friends of each of
+    ``user_pks``, with one query in either storage mode
+    """
+    user_pks = set(user_pks)
+    if not _undirected_friends():
+        return set(_friend_edges_qs(user_pks))
+    return {edge for a, b in _friend_edges_qs(user_pks) for edge in ((a, b), (b, a)) if edge[0] in user_pks}
+
+
+async def _afriend_edges(user_pks):
+    """
+    Async version of ``_friend_edges``
+    """
+    user_pks = set(user_pks)
+    if not _undirected_friends():
+        return {edge async for edge in _friend_edges_qs(user_pks)}
+    return {edge async for a, b in _friend_edges_qs(user_pks) for edge in ((a, b), (b, a)) if edge[0] in user_pks}
+
+
+def _friend_edges_qs(user_pks):
+    if not _undirected_friends():
+        return Friend.objects.filter(to_user__in=user_pks).values_list("to_user_id", "from_user_id")
+    return Friend.objects.filter(models.Q(from_user__in=user_pks) | models.Q(to_user__in=user_pks)).values_list(
+        "from_user_id", "to_user_id"
+    )
+
+
+def _count_mutual_friends(friends):
+    """
+    Count the friends each user shares with each friend of their friends
+
+    ``friends`` maps user primary keys to their friends' primary keys. The
+    friends of all those friends are fetched with one query, and a
+    ``Counter`` of ``(user_pk, candidate_pk)`` pairs is returned.
+    """
+    return _tally_mutual_friends(friends, _friend_edges(set().union(*friends.values())))
+
+
+async def _acount_mutual_friends(friends):
+    """
+    Async version of ``_count_mutual_friends``
+    """
+    return _tally_mutual_friends(friends, await _afriend_edges(set().union(*friends.values())))
+
+
+def _tally_mutual_friends(friends, edges):
+    friends_of = {}
+    for middle, candidate in edges:
+        friends_of.setdefault(middle, []).append(candidate)
+    return Counter(
+        (user_pk, candidate)
+        for user_pk, middles in friends.items()
+        for middle in middles
+        for candidate in friends_of.get(middle, ())
+    )
+
+
+def _inbox_pks(inbox, viewed=None, rejected=None):
+    """
+    Return the primary keys of the ``FriendshipManager._inbox`` rows, keeping
+    only the viewed (or unviewed) and rejected (or unrejected) requests when
+    ``viewed`` or ``rejected`` is ``True`` (or ``False``)
+    """
+    return [
+        pk
+        for pk, from_user_id, viewed_at, rejected_at, created in inbox
+        if (viewed is None or viewed == (viewed_at is not None))
+        and (rejected is None or rejected == (rejected_at is not None))
+    ]
+
+
+def _relation_ids_qs(type, user, among=None):
+    """
+    Return the ``values_list`` queryset of user ids behind the id set ``type``,
+    narrowed down to the primary keys ``among`` when given
+    """
+
+    def ids(qs, field):
+        if among is not None:
+            qs = qs.filter(**{f"{field}__in": among})
+        return qs.values_list(field, flat=True)
+
+    if type == "friends":
+        qs = ids(Friend.objects.filter(to_user=user), "from_user_id")
+        if _undirected_friends():
+            # A plain UNION also drops the duplicates of rows that are still
+            # mirrored while a conversion is in progress.
+            qs = qs.union(ids(Friend.objects.filter(from_user=user), "to_user_id"))
+        return qs
+    if type == "followers":
+        return ids(Follow.objects.filter(followee=user), "follower_id")
+    if type == "following":
+        return ids(Follow.objects.filter(follower=user), "followee_id")
+    if type == "blocked":
+        return ids(Block.objects.filter(blocked=user), "blocker_id")
+    if type == "blocking":
+        return ids(Block.objects.filter(blocker=user), "blocked_id")
+    if type == "blocks":
+        return _relation_ids_qs("blocking", user, among).union(_relation_ids_qs("blocked", user, among))
+    raise ValueError(f"No id set for cache type {type!r}")
+
+
+def _get_or_compute(key, compute, timeout=DEFAULT_TIMEOUT):
+    """
+    Return the value cached at ``key``, computing and caching it on a miss
+
+    Only one caller recomputes a missing key at a time. The first to take a
+    short-lived lock with ``cache.add`` does the work while the others poll for
+    its result for up to ``FRIENDSHIP_CACHE_LOCK_TIMEOUT`` seconds (the lock's
+    lifetime), so busting a hot key costs one recomputation rather than one per
+    concurrent request. Waiters that time out, or see the lock released without
+    a value (the holder failed, or could not cache it), compute the value
+    themselves. The value is cached for ``timeout`` seconds.
+
+    A key that cannot be cached (``None``, or busted inside an open
+    ``invalidation_buffer``) is computed without taking the lock.
+    """
+    return _get_many_or_compute([(key, compute, timeout)])[0]
+
+
+async def _aget_or_compute(key, compute, timeout=DEFAULT_TIMEOUT):
+    """
+    Async version of ``_get_or_compute``, where ``compute`` is a coroutine
+    function
+    """
+    return (await _aget_many_or_compute([(key, compute, timeout)]))[0]
+
+
+def _get_many_or_compute(entries):
+    """
+    Return the value cached for each ``(key, compute, timeout)`` of
+    ``entries``, fetched with one ``get_many``
+
+    Each miss is computed and cached as ``_get_or_compute`` does.
+    """
+    entries = list(entries)
+    values, misses = _lookups(entries, cache.get_many([key for key, compute, timeout in entries]))
+    for i in misses:
+        values[i] = _compute_once(*entries[i])
+    return values
+
+
+async def _aget_many_or_compute(entries):
+    """
+    Async version of ``_get_many_or_compute``, where each ``compute`` is a
+    coroutine function
+    """
+    entries = list(entries)
+    values, misses = _lookups(entries, await cache.aget_many([key for key, compute, timeout in entries]))
+    for i in misses:
+        values[i] = await _acompute_once(*entries[i])
+    return values
+
+
+def _lookups(entries, found):
+    """
+    Record one cache lookup per entry, returning the values ``found`` for the
+    entries (``None`` where missing) and the indexes of the missing ones
+    """
+    values, misses = [], []
+    for i, (key, compute, timeout) in enumerate(entries):
+        metrics.cache_lookup(key, key in found)
+        values.append(found.get(key))
+        if key not in found:
+            misses.append(i)
+    return values, misses
+
+
+def _compute_once(key, compute, timeout):
+    """
+    Compute and cache the value of the missing ``key`` under its lock, or wait
+    for the caller holding it, as described in ``_get_or_compute``
+    """
+    if cache._skip(key):
+        return compute()
+
+    lock_key, lock_timeout = _lock(key)
+    locked = cache.add(lock_key, 1, lock_timeout)
+    if not locked:
+        deadline = monotonic() + lock_timeout
+        while monotonic() < deadline:
+            sleep(0.05)
+            # Polled on the backend itself: the request cache memo would keep
+            # answering with the lock it saw first.
+            found = cache.backend.get_many([key, lock_key])
+            if key in found:
+                return found[key]
+            if lock_key not in found:
+                break
+
+    try:
+        value = compute()
+        cache.set(key, value, timeout)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return value
+
+
+async def _acompute_once(key, compute, timeout):
+    """
+    Async version of ``_compute_once``
+    """
+    if cache._skip(key):
+        return await compute()
+
+    lock_key, lock_timeout = _lock(key)
+    locked = await cache.aadd(lock_key, 1, lock_timeout)
+    if not locked:
+        deadline = monotonic() + lock_timeout
+        while monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            found = await cache.backend.aget_many([key, lock_key])
+            if key in found:
+                return found[key]
+            if lock_key not in found:
+                break
+
+    try:
+        value = await compute()
+        await cache.aset(key, value, timeout)
+    finally:
+        if locked:
+            await cache.adelete(lock_key)
+    return value
+
+
+def _lock(key):
+    return f"{key}:lock", getattr(settings, "FRIENDSHIP_CACHE_LOCK_TIMEOUT", 5)
+
+
+def _cached_ids(type, user):
+    """
+    Return the sorted primary keys cached for ``type``, querying and caching
+    them on a miss
+    """
+    key = cache_key(type, user.pk)
+    return _unpack_ids(_get_or_compute(key, lambda: _pack_ids(_relation_ids_qs(type, user)), cache_timeout(type)))
+
+
+async def _acached_ids(type, user):
+    """
+    Async version of ``_cached_ids``
+    """
+    key = await acache_key(type, user.pk)
+
+    async def compute():
+        return _pack_ids([pk async for pk in _relation_ids_qs(type, user)])
+
+    return _unpack_ids(await _aget_or_compute(key, compute, cache_timeout(type)))
+
+
+def _cached_id_sets(type, users):
+    """
+    Return the sorted primary keys cached for ``type`` for each of ``users``,
+    fetched with one ``get_many`` and computed as ``_cached_ids`` does on a
+    miss
+    """
+    keys = cache_keys((type, user.pk) for user in users)
+    values = _get_many_or_compute(
+        (key, lambda user=user: _pack_ids(_relation_ids_qs(type, user)), cache_timeout(type))
+        for key, user in zip(keys, users)
+    )
+    return [_unpack_ids(value) for value in values]
+
+
+async def _acached_id_sets(type, users):
+    """
+    Async version of ``_cached_id_sets``
+    """
+    keys = await acache_keys((type, user.pk) for user in users)
+
+    def compute(user):
+        async def compute():
+            return _pack_ids([pk async for pk in _relation_ids_qs(type, user)])
+
+        return compute
+
+    values = await _aget_many_or_compute((key, compute(user), cache_timeout(type)) for key, user in zip(keys, users))
+    return [_unpack_ids(value) for value in values]
+
+
+def _intersect(ids1, ids2):
+    """
+    Return the keys present in both sorted ``ids1`` and ``ids2``, sorted
+
+    Binary searches the larger sequence for each key of the smaller one.
+    """
+    small, large = sorted((ids1, ids2), key=len)
+    return [pk for pk in small if _contains(large, pk)]
+
+
+def _friends_of_friends_qs(user):
+    """
+    Return the ids of the friends of ``user``'s friends who are neither
+    ``user`` nor already friends with them, ranked by mutual friend count
+    """
+    friend_ids = Friend.objects.filter(to_user=user).values("from_user_id")
+    return (
+        Friend.objects.filter(to_user__in=friend_ids)
+        .exclude(from_user=user)
+        .exclude(from_user__in=friend_ids)
+        .values("from_user_id")
+        .annotate(mutual=models.Count("to_user_id"))
+        .order_by("-mutual", "from_user_id")
+        .values_list("from_user_id", flat=True)
+    )
+
+
+def _friends_of_friends(user, limit):
+    """
+    Return the first ``limit`` ids of ``_friends_of_friends_qs``, ranked in
+    Python from two queries with ``FRIENDSHIP_UNDIRECTED_STORAGE``
+    """
+    if not _undirected_friends():
+        return list(_friends_of_friends_qs(user)[:limit])
+
+    friends = {friend_pk for user_pk, friend_pk in _friend_edges([user.pk])}
+    return _rank_friends_of_friends(user.pk, friends, _count_mutual_friends({user.pk: friends}), limit)
+
+
+async def _afriends_of_friends(user, limit):
+    """
+    Async version of ``_friends_of_friends``
+    """
+    if not _undirected_friends():
+        return [pk async for pk in _friends_of_friends_qs(user)[:limit]]
+
+    friends = {friend_pk for user_pk, friend_pk in await _afriend_edges([user.pk])}
+    return _rank_friends_of_friends(user.pk, friends, await _acount_mutual_friends({user.pk: friends}), limit)
+
+
+def _rank_friends_of_friends(user_pk, friends, counts, limit):
+    mutual = {candidate: n for (_, candidate), n in counts.items() if candidate != user_pk and candidate not in friends}
+    return sorted(mutual, key=lambda pk: (-mutual[pk], pk))[:limit]
+
+
+def _friends_of_friends_limit(limit):
+    if limit is None:
+        limit = getattr(settings, "FRIENDSHIP_PAGE_SIZE", 50)
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return limit
+
+
+def _ranking(ids, limit):
+    """
+    Pack the first ``limit`` ids of a ranking into the cached ``(ids,
+    complete)`` value, where ``complete`` tells there were no more
+    """
+    return _pack_ids(ids, sort=False), len(ids) < limit
+
+
+def _cached_ranking(value, limit):
+    """
+    Return the first ``limit`` ids of a cached ``(ids, complete)`` ranking, or
+    ``None`` when it is too short to tell
+    """
+    ids, complete = value
+    ids = _unpack_ids(ids)
+    if complete or len(ids) >= limit:
+        return ids[:limit]
+    return None
+
+
+def _suggestion_size():
+    return getattr(settings, "FRIENDSHIP_SUGGESTION_COUNT", 50)
+
+
+def _compute_suggestions(user_pks):
+    """
+    Rank friend suggestions for each of ``user_pks``, returning a dict of
+    ``{user_pk: [candidate_pk, ...]}``
+
+    A candidate scores ``FRIENDSHIP_SUGGESTION_WEIGHTS["mutual_friends"]`` for
+    each friend they share with the user and ``["follows"]`` for each user the
+    user follows who follows them. Friends, users with a pending request in
+    either direction and blocks in either direction are left out. The whole
+    batch takes five queries however many users it holds.
+    """
+    user_pks = list(user_pks)
+    friend_edges = _friend_edges(user_pks)
+    if _undirected_friends():
+        mutual = _count_mutual_friends(_friends_by_user(user_pks, friend_edges))
+        mutual = [(user_pk, candidate, n) for (user_pk, candidate), n in mutual.items()]
+    else:
+        mutual = _mutual_friends_qs(user_pks)
+    follows, requests, blocks = _suggestion_qs(user_pks)
+    return _rank_suggestions(user_pks, friend_edges, mutual, follows, requests, blocks)
+
+
+async def _acompute_suggestions(user_pks):
+    """
+    Async version of ``_compute_suggestions``
+    """
+    user_pks = list(user_pks)
+    friend_edges = await _afriend_edges(user_pks)
+    if _undirected_friends():
+        mutual = await _acount_mutual_friends(_friends_by_user(user_pks, friend_edges))
+        mutual = [(user_pk, candidate, n) for (user_pk, candidate), n in mutual.items()]
+    else:
+        mutual = [row async for row in _mutual_friends_qs(user_pks)]
+    follows, requests, blocks = _suggestion_qs(user_pks)
+    follows = [row async for row in follows]
+    requests = [row async for row in requests]
+    blocks = [row async for row in blocks]
+    return _rank_suggestions(user_pks, friend_edges, mutual, follows, requests, blocks)
+
+
+def _friends_by_user(user_pks, friend_edges):
+    friends = {pk: set() for pk in user_pks}
+    for user_pk, friend_pk in friend_edges:
+        friends[user_pk].add(friend_pk)
+    return friends
+
+
+def _mutual_friends_qs(user_pks):
+    """
+    Return ``(user_pk, candidate_pk, mutual friend count)`` rows for mirrored
+    storage, counting friend -> friend's friend paths by the user at the
+    other end
+    """
+    return (
+        Friend.objects.filter(to_user__friends__from_user__in=user_pks)
+        .values_list("to_user__friends__from_user", "from_user_id")
+        .annotate(n=models.Count("to_user_id"))
+        .order_by()
+    )
+
+
+def _suggestion_qs(user_pks):
+    """
+    Return the follow overlap, pending request and block querysets of
+    ``_compute_suggestions``
+    """
+    # followee -> followee's followee, keyed by the follower
+    follows = (
+        Follow.objects.filter(follower__followers__follower__in=user_pks)
+        .values_list("follower__followers__follower", "followee_id")
+        .annotate(n=models.Count("follower_id"))
+        .order_by()
+    )
+    requests = FriendshipRequest.objects.filter(
+        models.Q(from_user__in=user_pks) | models.Q(to_user__in=user_pks), rejected__isnull=True
+    ).values_list("from_user_id", "to_user_id")
+    blocks = Block.objects.filter(models.Q(blocker__in=user_pks) | models.Q(blocked__in=user_pks)).values_list(
+        "blocker_id", "blocked_id"
+    )
+    return follows, requests, blocks
+
+
+def _rank_suggestions(user_pks, friend_edges, mutual, follows, requests, blocks):
+    """
+    Score and rank the candidates of ``_compute_suggestions`` from the rows it
+    fetched
+    """
+    weights = {"mutual_friends": 2, "follows": 1, **getattr(settings, "FRIENDSHIP_SUGGESTION_WEIGHTS", {})}
+    scores = {pk: {} for pk in user_pks}
+    for rows, weight in ((mutual, weights["mutual_friends"]), (follows, weights["follows"])):
+        for user_pk, candidate_pk, n in rows:
+            candidates = scores[user_pk]
+            candidates[candidate_pk] = candidates.get(candidate_pk, 0) + n * weight
+
+    excluded = {pk: {pk} for pk in user_pks}
+    for rows in (friend_edges, requests, blocks):
+        for a, b in rows:
+            for user_pk, other in ((a, b), (b, a)):
+                if user_pk in excluded:
+                    excluded[user_pk].add(other)
+
+    size = _suggestion_size()
+    return {
+        user_pk: sorted((pk for pk in candidates if pk not in excluded[user_pk]), key=lambda pk: (-candidates[pk], pk))[
+            :size
+        ]
+        for user_pk, candidates in scores.items()
+    }
+
+
+def _refresh_suggestions_on_commit(user_pks):
+    """
+    Recompute the cached suggestions of ``user_pks`` once the current
+    transaction commits
+
+    Only the users whose suggestions are cached are recomputed, with
+    ``refresh_suggestions``; the others get theirs on first use, and the
+    refresh costs a single ``get_many`` when none are cached. The users ranked
+    through them, such as their friends, are left to
+    ``refresh_friend_suggestions`` or the cache timeout.
+    """
+    user_pks = list(set(user_pks))
+
+    def refresh():
+        keys = cache_keys(("suggestions", pk) for pk in user_pks)
+        cached = cache.get_many(keys)
+        stale = [pk for key, pk in zip(keys, user_pks) if key in cached]
+        if stale:
+            Friend.objects.refresh_suggestions(stale)
+
+    transaction.on_commit(refresh, using=router.db_for_write(Friend))
+
+
+def _encode_cursor(created, pk):
+    raw = f"{created.isoformat()}|{pk}"
+    return urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor):
+    """
+    Decode a cursor produced by ``_encode_cursor``, raising ``ValueError`` if
+    it is malformed
+    """
+    try:
+        raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created, pk = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created), int(pk)
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor {cursor!r}") from e
+
+
+def _page(type, user_pk, qs, user_field, cursor=None, limit=None):
+    """
+    Return one keyset-paginated ``RelationshipPage`` of ``qs``, newest first
+
+    Rows are ordered on ``(created, id)`` so each page is a single index range
+    scan no matter how deep it is. The first page at the default page size is
+    cached as a window of user ids under ``type``.
+    """
+    rows, limit, cacheable = _page_rows(qs, user_field, cursor, limit)
+
+    def fetch():
+        return _page_window(list(rows), limit)
+
+    if cacheable:
+        ids, next_cursor = _get_or_compute(cache_key(type, user_pk), fetch, cache_timeout(type))
+    else:
+        ids, next_cursor = fetch()
+
+    return RelationshipPage(LazyUserList(_unpack_ids(ids), is_sorted=False), next_cursor)
+
+
+async def _apage(type, user_pk, qs, user_field, cursor=None, limit=None):
+    """
+    Async version of ``_page``
+    """
+    rows, limit, cacheable = _page_rows(qs, user_field, cursor, limit)
+
+    async def fetch():
+        return _page_window([row async for row in rows], limit)
+
+    if cacheable:
+        key = await acache_key(type, user_pk)
+        ids, next_cursor = await _aget_or_compute(key, fetch, cache_timeout(type))
+    else:
+        ids, next_cursor = await fetch()
+
+    return RelationshipPage(LazyUserList(_unpack_ids(ids), is_sorted=False), next_cursor)
+
+
+def _page_rows(qs, user_field, cursor, limit):
+    """
+    Return the queryset of ``(user id, created, id)`` rows for one page, the
+    resolved ``limit`` and whether the page is the cacheable first page
+    """
+    page_size = getattr(settings, "FRIENDSHIP_PAGE_SIZE", 50)
+    if limit is None:
+        limit = page_size
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+
+    if cursor is not None:
+        created, pk = _decode_cursor(cursor)
+        qs = qs.filter(models.Q(created__lt=created) | models.Q(created=created, pk__lt=pk))
+
+    rows = qs.order_by("-created", "-pk").values_list(user_field, "created", "pk")[: limit + 1]
+    return rows, limit, cursor is None and limit == page_size
+
+
+def _page_window(rows, limit):
+    next_cursor = _encode_cursor(*rows[limit - 1][1:]) if len(rows) > limit else None
+    return _pack_ids([row[0] for row in rows[:limit]], sort=False), next_cursor
+
+
+class LazyModelList(Sequence, ABC):
+    """
+    A list of model instances backed by their primary keys
+
+    ``len()``, truthiness and ``in`` are answered from the keys alone. The
+    instances are fetched in one bulk query the first time the list is indexed
+    or iterated, and slicing an unfetched list returns another lazy list.
+    ``async for`` fetches them with the async ORM instead.
+    Membership is a binary search unless the keys were given in an order other
+    than sorted (``is_sorted=False``), as pages are. Keys whose rows no longer
+    exist (deleted since the keys were cached) are dropped when the instances
+    are fetched, so ``len()`` and ``in`` agree with iteration from then on.
+
+    Subclasses implement ``get_queryset()``.
+    """
+
+    def __init__(self, ids, is_sorted=True):
+        self.ids = ids
+        self.is_sorted = is_sorted
+        self._objects = None
+
+    @abstractmethod
+    def get_queryset(self):
+        """Return the queryset the instances are fetched from"""
+
+    def _fetch(self):
+        if self._objects is None:
+            self._hydrate(self.get_queryset().in_bulk(list(self.ids)))
+        return self._objects
+
+    def _hydrate(self, objects):
+        if len(objects) < len(self.ids):
+            self.ids = [pk for pk in self.ids if pk in objects]
+        self._objects = [objects[pk] for pk in self.ids]
+        if metrics._get_hook() is not None:
+            metrics.emit("friendship.rows", len(self._objects), model=self.get_queryset().model._meta.label)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __bool__(self):
+        return len(self.ids) > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) and self._objects is None:
+            return type(self)(self.ids[index], is_sorted=self.is_sorted and (index.step or 1) > 0)
+        return self._fetch()[index]
+
+    def __iter__(self):
+        return iter(self._fetch())
+
+    async def __aiter__(self):
+        if self._objects is None:
+            self._hydrate(await self.get_queryset().ain_bulk(list(self.ids)))
+        for obj in self._objects:
+            yield obj
+
+    def __contains__(self, obj):
+        pk = getattr(obj, "pk", obj)
+        if self.is_sorted:
+            return _contains(self.ids, pk)
+        return pk in self.ids
+
+    def __eq__(self, other):
+        if isinstance(other, LazyModelList):
+            return type(self) is type(other) and list(self.ids) == list(other.ids)
+        if isinstance(other, (list, tuple)):
+            return self._fetch() == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {list(self.ids)!r}>"
+
+
+class LazyUserList(LazyModelList):
+    """A ``LazyModelList`` of users"""
+
+    def get_queryset(self):
+        return get_user_model()._default_manager.all()
+
+
+class LazyRequestList(LazyModelList):
+    """A ``LazyModelList`` of friendship requests, fetched with their users"""
+
+    def get_queryset(self):
+        return Friend.objects._friendship_request_select_related(
+            FriendshipRequest.objects.all(), "from_user", "to_user"
+        )
+
+
+RelationshipStatus = namedtuple(
+    "RelationshipStatus",
+    [
+        "is_friend",
+        "is_following",
+        "is_followed_by",
+        "is_blocking",
+        "is_blocked_by",
+        "request_sent",
+        "request_received",
+    ],
+)
+
+
+def relationship_status_many(viewer, users):
+    """
+    Resolve how ``viewer`` relates to each of ``users`` in one pass
+
+    Returns a dict mapping each user's primary key to a ``RelationshipStatus``.
+    ``viewer``'s cached id sets are fetched with a single ``get_many`` and
+    answer what they can. A set that is not cached is not loaded in full:
+    it costs one query narrowed down to ``users``, so the cost grows with
+    neither ``len(users)`` nor the size of ``viewer``'s relationships.
+    ``request_sent`` and ``request_received`` only count pending (unrejected)
+    requests.
+    """
+    pks = [user.pk for user in users]
+    id_types = ("friends", "following", "followers", "blocking", "blocked")
+    types = (*id_types, "sent_requests", "requests")
+    keys = dict(zip(types, cache_keys((type, viewer.pk) for type in types)))
+    cached = cache.get_many(list(keys.values()))
+
+    related = {}
+    for type in id_types:
+        key = keys[type]
+        metrics.cache_lookup(key, key in cached)
+        if key in cached:
+            ids = _unpack_ids(cached[key])
+            related[type] = {pk for pk in pks if _contains(ids, pk)}
+        else:
+            related[type] = set(_relation_ids_qs(type, viewer, among=pks))
+
+    sent = cached.get(keys["sent_requests"])
+    received = cached.get(keys["requests"])
+    if sent is not None and received is not None:
+        requested = {r.to_user_id for r in sent if r.rejected is None}
+        requested_by = {from_user_id for pk, from_user_id, viewed, rejected, created in received if rejected is None}
+    else:
+        rows = FriendshipRequest.objects.filter(
+            models.Q(from_user=viewer, to_user__in=pks) | models.Q(from_user__in=pks, to_user=viewer),
+            rejected__isnull=True,
+        ).values_list("from_user_id", "to_user_id")
+        requested, requested_by = set(), set()
+        for from_user_id, to_user_id in rows:
+            if from_user_id == viewer.pk:
+                requested.add(to_user_id)
+            else:
+                requested_by.add(from_user_id)
+
+    return {
+        pk: RelationshipStatus(
+            is_friend=pk in related["friends"],
+            is_following=pk in related["following"],
+            is_followed_by=pk in related["followers"],
+            is_blocking=pk in related["blocking"],
+            is_blocked_by=pk in related["blocked"],
+            request_sent=pk in requested,
+            request_received=pk in requested_by,
+        )
+        for pk in pks
+    }
 
 
 class FriendshipRequest(models.Model):
@@ -102,60 +1216,95 @@ class FriendshipRequest(models.Model):
         verbose_name = _("Friendship Request")
         verbose_name_plural = _("Friendship Requests")
         unique_together = ("from_user", "to_user")
+        indexes = [
+            # The inbox of a user, in id order
+            models.Index(fields=["to_user", "id"], name="request_to_user_id_idx"),
+            # Pending requests received by a batch of users (suggestions)
+            models.Index(fields=["to_user", "rejected", "from_user"], name="request_to_user_rejected_idx"),
+        ]
 
     def __str__(self):
         return f"User #{self.from_user_id} friendship requested #{self.to_user_id}"
 
     def accept(self):
-        """Accept this friendship request"""
-        # Optional cap on friends per user. Unset (the default) means unlimited,
-        # so existing installs are unaffected. Checked before creating anything
-        # so a rejected accept leaves no partial state and the request stands.
-        max_friends = getattr(settings, "FRIENDSHIP_MAX_FRIENDS", None)
-        if max_friends is not None:
-            for user in (self.from_user, self.to_user):
-                if Friend.objects.friend_count(user) >= max_friends:
-                    raise MaxFriendsExceededError(
-                        f"User '{user}' already has the maximum number of friends ({max_friends})."
-                    )
-
-        Friend.objects.create(from_user=self.from_user, to_user=self.to_user)
-
-        Friend.objects.create(from_user=self.to_user, to_user=self.from_user)
+        """Accept this friendship request
 
-        friendship_request_accepted.send(sender=self, from_user=self.from_user, to_user=self.to_user)
-
-        self.delete()
+        Runs in a single transaction: the ``Friend`` rows are inserted with one
+        ``bulk_create`` and the request (plus any reverse request) is removed
+        with one delete, so a failure leaves nothing half-created. The affected
+        caches are busted with one ``delete_many``.
+        """
+        with transaction.atomic():
+            # Optional cap on friends per user. Unset (the default) means
+            # unlimited, so existing installs are unaffected. Checked before
+            # creating anything so a rejected accept leaves no partial state and
+            # the request stands.
+            max_friends = getattr(settings, "FRIENDSHIP_MAX_FRIENDS", None)
+            if max_friends is not None:
+                self._check_max_friends(max_friends)
+
+            Friend.objects.bulk_create(_friend_rows(self.from_user, self.to_user))
+
+            friendship_request_accepted.send(sender=self, from_user=self.from_user, to_user=self.to_user)
+
+            # Delete this request and any reverse request
+            FriendshipRequest.objects.filter(
+                models.Q(pk=self.pk) | models.Q(from_user=self.to_user, to_user=self.from_user)
+            ).delete()
+            self.pk = None
+
+        bust_caches(
+            [
+                # Requests caches - this request and the reverse one are deleted
+                ("requests", self.to_user_id),
+                ("sent_requests", self.from_user_id),
+                ("requests", self.from_user_id),
+                ("sent_requests", self.to_user_id),
+                # Friends caches - new friends added
+                ("friends", self.to_user_id),
+                ("friends", self.from_user_id),
+            ]
+        )
+        _adjust_counts([("friends", self.to_user_id, 1), ("friends", self.from_user_id, 1)])
+        return True
 
-        # Delete any reverse requests
-        FriendshipRequest.objects.filter(from_user=self.to_user, to_user=self.from_user).delete()
+    def _check_max_friends(self, max_friends):
+        """Raise ``MaxFriendsExceededError`` if either user is at the cap
 
-        # Bust requests cache - request is deleted
-        bust_cache("requests", self.to_user.pk)
-        bust_cache("sent_requests", self.from_user.pk)
-        # Bust reverse requests cache - reverse request might be deleted
-        bust_cache("requests", self.from_user.pk)
-        bust_cache("sent_requests", self.to_user.pk)
-        # Bust friends cache - new friends added
-        bust_cache("friends", self.to_user.pk)
-        bust_cache("friends", self.from_user.pk)
-        return True
+        Both user rows are locked (in primary key order, so concurrent accepts
+        cannot deadlock) before their friends are counted in one grouped query,
+        so two accepts racing for a user's last slot cannot both succeed.
+        """
+        user_pks = sorted({self.from_user_id, self.to_user_id})
+        list(get_user_model()._default_manager.select_for_update().filter(pk__in=user_pks).order_by("pk").values("pk"))
+        if _undirected_friends():
+            counts = Counter(user_pk for user_pk, friend_pk in _friend_edges(user_pks))
+        else:
+            counts = dict(
+                Friend.objects.filter(to_user__in=user_pks)
+                .values_list("to_user")
+                .annotate(count=models.Count("pk"))
+                .order_by()
+            )
+        for user in (self.from_user, self.to_user):
+            if counts.get(user.pk, 0) >= max_friends:
+                raise MaxFriendsExceededError(
+                    f"User '{user}' already has the maximum number of friends ({max_friends})."
+                )
 
     def reject(self):
         """reject this friendship request"""
         self.rejected = timezone.now()
         self.save()
         friendship_request_rejected.send(sender=self)
-        bust_cache("requests", self.to_user.pk)
-        bust_cache("sent_requests", self.from_user.pk)
+        bust_caches([("requests", self.to_user.pk), ("sent_requests", self.from_user.pk)])
         return True
 
     def cancel(self):
         """cancel this friendship request"""
         friendship_request_canceled.send(sender=self)
         self.delete()
-        bust_cache("requests", self.to_user.pk)
-        bust_cache("sent_requests", self.from_user.pk)
+        bust_caches([("requests", self.to_user.pk), ("sent_requests", self.from_user.pk)])
         return True
 
     def mark_viewed(self):
@@ -165,125 +1314,168 @@ class FriendshipRequest(models.Model):
         bust_cache("requests", self.to_user.pk)
         return True
 
+    async def aaccept(self):
+        """Async version of ``accept()``"""
+        return await sync_to_async(self.accept)()
+
+    async def areject(self):
+        """Async version of ``reject()``"""
+        return await sync_to_async(self.reject)()
+
+    async def acancel(self):
+        """Async version of ``cancel()``"""
+        return await sync_to_async(self.cancel)()
+
+    async def amark_viewed(self):
+        """Async version of ``mark_viewed()``"""
+        return await sync_to_async(self.mark_viewed)()
+
 
 class FriendshipManager(models.Manager):
     """Friendship manager"""
 
     def friends(self, user):
         """Return a list of all friends"""
-        key = cache_key("friends", user.pk)
-        friends = cache.get(key)
+        return LazyUserList(_cached_ids("friends", user))
 
-        if friends is None:
-            qs = Friend.objects.select_related("from_user").filter(to_user=user)
-            friends = [u.from_user for u in qs]
-            cache.set(key, friends)
+    async def afriends(self, user):
+        """Async version of ``friends()``"""
+        return LazyUserList(await _acached_ids("friends", user))
 
-        return friends
+    def friends_page(self, user, cursor=None, limit=None):
+        """Return a ``RelationshipPage`` of friends, most recent first
+
+        Pass the previous page's ``next_cursor`` as ``cursor`` to fetch the
+        following page. ``limit`` defaults to ``FRIENDSHIP_PAGE_SIZE`` (50).
+        """
+        return _page("friends_page", user.pk, *self._friends_page_qs(user), cursor, limit)
+
+    async def afriends_page(self, user, cursor=None, limit=None):
+        """Async version of ``friends_page()``"""
+        return await _apage("friends_page", user.pk, *self._friends_page_qs(user), cursor, limit)
+
+    def _friends_page_qs(self, user):
+        """Return the ``Friend`` rows of ``user`` and the field holding the
+        friend's id"""
+        if not _undirected_friends():
+            return Friend.objects.filter(to_user=user), "from_user_id"
+        qs = Friend.objects.filter(models.Q(to_user=user) | models.Q(from_user=user)).annotate(
+            friend_id=models.Case(models.When(to_user=user, then="from_user_id"), default="to_user_id")
+        )
+        return qs, "friend_id"
 
     def friend_count(self, user):
-        """Return the number of friends ``user`` currently has."""
-        return Friend.objects.filter(to_user=user).count()
+        """Return the number of friends ``user`` currently has.
+
+        Served from a cached counter that is incremented and decremented as
+        friendships are made and removed, so no friends are loaded.
+        """
+        return _cached_count("friends", user)
+
+    async def afriend_count(self, user):
+        """Async version of ``friend_count()``"""
+        return await _acached_count("friends", user)
+
+    def _inbox(self, user):
+        """Return the cached inbox of friendship requests sent to ``user``
+
+        The inbox is a tuple of compact ``(id, from_user_id, viewed, rejected,
+        created)`` rows ordered by id. Every received-request list and count
+        is projected from it in memory, so they share one cache entry and one
+        query.
+        """
+        rows = self._inbox_rows(user)
+        return _get_or_compute(cache_key("requests", user.pk), lambda: tuple(rows), cache_timeout("requests"))
+
+    async def _ainbox(self, user):
+        rows = self._inbox_rows(user)
+
+        async def compute():
+            return tuple([row async for row in rows])
+
+        return await _aget_or_compute(await acache_key("requests", user.pk), compute, cache_timeout("requests"))
+
+    def _inbox_rows(self, user):
+        return (
+            FriendshipRequest.objects.filter(to_user=user)
+            .order_by("pk")
+            .values_list("pk", "from_user_id", "viewed", "rejected", "created")
+        )
 
     def requests(self, user):
         """Return a list of friendship requests"""
-        key = cache_key("requests", user.pk)
-        requests = cache.get(key)
+        return LazyRequestList(_inbox_pks(self._inbox(user)))
 
-        if requests is None:
-            qs = FriendshipRequest.objects.filter(to_user=user)
-            qs = self._friendship_request_select_related(qs, "from_user", "to_user")
-            requests = list(qs)
-            cache.set(key, requests)
-
-        return requests
+    async def arequests(self, user):
+        """Async version of ``requests()``"""
+        return LazyRequestList(_inbox_pks(await self._ainbox(user)))
 
     def sent_requests(self, user):
         """Return a list of friendship requests from user"""
-        key = cache_key("sent_requests", user.pk)
-        requests = cache.get(key)
+        qs = self._sent_requests_qs(user)
+        return _get_or_compute(cache_key("sent_requests", user.pk), lambda: list(qs), cache_timeout("sent_requests"))
+
+    async def asent_requests(self, user):
+        """Async version of ``sent_requests()``"""
+        qs = self._sent_requests_qs(user)
+
+        async def compute():
+            return [request async for request in qs]
 
-        if requests is None:
-            qs = FriendshipRequest.objects.filter(from_user=user)
-            qs = self._friendship_request_select_related(qs, "from_user", "to_user")
-            requests = list(qs)
-            cache.set(key, requests)
+        key = await acache_key("sent_requests", user.pk)
+        return await _aget_or_compute(key, compute, cache_timeout("sent_requests"))
 
-        return requests
+    def _sent_requests_qs(self, user):
+        qs = FriendshipRequest.objects.filter(from_user=user)
+        return self._friendship_request_select_related(qs, "from_user", "to_user")
 
     def unread_requests(self, user):
         """Return a list of unread friendship requests"""
-        key = cache_key("unread_requests", user.pk)
-        unread_requests = cache.get(key)
+        return LazyRequestList(_inbox_pks(self._inbox(user), viewed=False))
 
-        if unread_requests is None:
-            qs = FriendshipRequest.objects.filter(to_user=user, viewed__isnull=True)
-            qs = self._friendship_request_select_related(qs, "from_user", "to_user")
-            unread_requests = list(qs)
-            cache.set(key, unread_requests)
-
-        return unread_requests
+    async def aunread_requests(self, user):
+        """Async version of ``unread_requests()``"""
+        return LazyRequestList(_inbox_pks(await self._ainbox(user), viewed=False))
 
     def unread_request_count(self, user):
         """Return a count of unread friendship requests"""
-        key = cache_key("unread_request_count", user.pk)
-        count = cache.get(key)
-
-        if count is None:
-            count = FriendshipRequest.objects.filter(to_user=user, viewed__isnull=True).count()
-            cache.set(key, count)
+        return len(_inbox_pks(self._inbox(user), viewed=False))
 
-        return count
+    async def aunread_request_count(self, user):
+        """Async version of ``unread_request_count()``"""
+        return len(_inbox_pks(await self._ainbox(user), viewed=False))
 
     def read_requests(self, user):
         """Return a list of read friendship requests"""
-        key = cache_key("read_requests", user.pk)
-        read_requests = cache.get(key)
-
-        if read_requests is None:
-            qs = FriendshipRequest.objects.filter(to_user=user, viewed__isnull=False)
-            qs = self._friendship_request_select_related(qs, "from_user", "to_user")
-            read_requests = list(qs)
-            cache.set(key, read_requests)
+        return LazyRequestList(_inbox_pks(self._inbox(user), viewed=True))
 
-        return read_requests
+    async def aread_requests(self, user):
+        """Async version of ``read_requests()``"""
+        return LazyRequestList(_inbox_pks(await self._ainbox(user), viewed=True))
 
     def rejected_requests(self, user):
         """Return a list of rejected friendship requests"""
-        key = cache_key("rejected_requests", user.pk)
-        rejected_requests = cache.get(key)
+        return LazyRequestList(_inbox_pks(self._inbox(user), rejected=True))
 
-        if rejected_requests is None:
-            qs = FriendshipRequest.objects.filter(to_user=user, rejected__isnull=False)
-            qs = self._friendship_request_select_related(qs, "from_user", "to_user")
-            rejected_requests = list(qs)
-            cache.set(key, rejected_requests)
-
-        return rejected_requests
+    async def arejected_requests(self, user):
+        """Async version of ``rejected_requests()``"""
+        return LazyRequestList(_inbox_pks(await self._ainbox(user), rejected=True))
 
     def unrejected_requests(self, user):
         """All requests that haven't been rejected"""
-        key = cache_key("unrejected_requests", user.pk)
-        unrejected_requests = cache.get(key)
-
-        if unrejected_requests is None:
-            qs = FriendshipRequest.objects.filter(to_user=user, rejected__isnull=True)
-            qs = self._friendship_request_select_related(qs, "from_user", "to_user")
-            unrejected_requests = list(qs)
-            cache.set(key, unrejected_requests)
+        return LazyRequestList(_inbox_pks(self._inbox(user), rejected=False))
 
-        return unrejected_requests
+    async def aunrejected_requests(self, user):
+        """Async version of ``unrejected_requests()``"""
+        return LazyRequestList(_inbox_pks(await self._ainbox(user), rejected=False))
 
     def unrejected_request_count(self, user):
         """Return a count of unrejected friendship requests"""
-        key = cache_key("unrejected_request_count", user.pk)
-        count = cache.get(key)
+        return len(_inbox_pks(self._inbox(user), rejected=False))
 
-        if count is None:
-            count = FriendshipRequest.objects.filter(to_user=user, rejected__isnull=True).count()
-            cache.set(key, count)
-
-        return count
+    async def aunrejected_request_count(self, user):
+        """Async version of ``unrejected_request_count()``"""
+        return len(_inbox_pks(await self._ainbox(user), rejected=False))
 
     def request_exists(self, from_user, to_user):
         """Return ``True`` if a friendship request exists between the two users
@@ -296,6 +1488,12 @@ class FriendshipManager(models.Manager):
             models.Q(from_user=from_user, to_user=to_user) | models.Q(from_user=to_user, to_user=from_user)
         ).exists()
 
+    async def arequest_exists(self, from_user, to_user):
+        """Async version of ``request_exists()``"""
+        return await FriendshipRequest.objects.filter(
+            models.Q(from_user=from_user, to_user=to_user) | models.Q(from_user=to_user, to_user=from_user)
+        ).aexists()
+
     def add_friend(self, from_user, to_user, message=None):
         """Create a friendship request"""
         if from_user == to_user:
@@ -333,12 +1531,15 @@ class FriendshipManager(models.Manager):
             request.created = timezone.now()
             request.save()
 
-        bust_cache("requests", to_user.pk)
-        bust_cache("sent_requests", from_user.pk)
+        bust_caches([("requests", to_user.pk), ("sent_requests", from_user.pk)])
         friendship_request_created.send(sender=request)
 
         return request
 
+    async def aadd_friend(self, from_user, to_user, message=None):
+        """Async version of ``add_friend()``"""
+        return await sync_to_async(self.add_friend)(from_user, to_user, message)
+
     def remove_friend(self, from_user, to_user):
         """Destroy a friendship relationship"""
         try:
@@ -347,26 +1548,177 @@ class FriendshipManager(models.Manager):
             if qs:
                 friendship_removed.send(sender=qs[0], from_user=from_user, to_user=to_user)
                 qs.delete()
-                bust_cache("friends", to_user.pk)
-                bust_cache("friends", from_user.pk)
+                bust_caches([("friends", to_user.pk), ("friends", from_user.pk)])
+                _adjust_counts([("friends", to_user.pk, -1), ("friends", from_user.pk, -1)])
                 return True
             else:
                 return False
         except Friend.DoesNotExist:
             return False
 
-    def are_friends(self, user1, user2):
-        """Are these two users friends?"""
-        friends1 = cache.get(cache_key("friends", user1.pk))
-        friends2 = cache.get(cache_key("friends", user2.pk))
-        if friends1 and user2 in friends1 or friends2 and user1 in friends2:
-            return True
+    async def aremove_friend(self, from_user, to_user):
+        """Async version of ``remove_friend()``"""
+        return await sync_to_async(self.remove_friend)(from_user, to_user)
+
+    def import_friendships(self, pairs, batch_size=None):
+        """Create friendships directly, without going through requests
+
+        ``pairs`` is an iterable of ``(user1, user2)`` tuples of users or
+        primary keys. The ``Friend`` rows (one canonical row per pair with
+        ``FRIENDSHIP_UNDIRECTED_STORAGE``, a mirrored pair otherwise) are
+        inserted with ``bulk_create`` and pairs that are already friends are
+        skipped. Returns
+        the list of ``Friend`` rows that were created, sends one
+        ``friendships_imported`` signal and busts the affected caches in one
+        round trip. Pending requests are left alone.
+        """
+        pairs = list(pairs)
+        if any(user1 == user2 for user1, user2 in pairs):
+            raise ValidationError("Users cannot be friends with themselves")
+
+        if _undirected_friends():
+            rows = [sorted(pair, key=lambda user: getattr(user, "pk", user)) for pair in pairs]
         else:
-            try:
-                Friend.objects.get(to_user=user1, from_user=user2)
-                return True
-            except Friend.DoesNotExist:
-                return False
+            rows = [(u1, u2) for pair in pairs for u1, u2 in (pair, pair[::-1])]
+        created = _bulk_create_pairs(Friend, "from_user", "to_user", rows, batch_size)
+        if created:
+            # A canonical row makes friends of both of its users
+            users = [f.to_user_id for f in created]
+            if _undirected_friends():
+                users += [f.from_user_id for f in created]
+            friendships_imported.send(sender=Friend, friendships=created)
+            bust_caches(("friends", pk) for pk in users)
+            _adjust_counts(("friends", pk, 1) for pk in users)
+        return created
+
+    async def aimport_friendships(self, pairs, batch_size=None):
+        """Async version of ``import_friendships()``"""
+        return await sync_to_async(self.import_friendships)(pairs, batch_size)
+
+    def are_friends(self, user1, user2):
+        """Are these two users friends?
+
+        Answered from either user's cached friend ids when one is cached,
+        otherwise with a single ``EXISTS`` query.
+        """
+        cached = _cached_contains(("friends", user1.pk, user2.pk), ("friends", user2.pk, user1.pk))
+        if cached is not None:
+            return cached
+        return _friendship_qs(user1, user2).exists()
+
+    async def aare_friends(self, user1, user2):
+        """Async version of ``are_friends()``"""
+        cached = await _acached_contains(("friends", user1.pk, user2.pk), ("friends", user2.pk, user1.pk))
+        if cached is not None:
+            return cached
+        return await _friendship_qs(user1, user2).aexists()
+
+    def mutual_friends(self, user1, user2):
+        """Return a list of the friends ``user1`` and ``user2`` have in common
+
+        Intersects the two users' cached friend ids, so it makes no query when
+        both are cached until the list is iterated.
+        """
+        return LazyUserList(_intersect(*_cached_id_sets("friends", [user1, user2])))
+
+    async def amutual_friends(self, user1, user2):
+        """Async version of ``mutual_friends()``"""
+        return LazyUserList(_intersect(*await _acached_id_sets("friends", [user1, user2])))
+
+    def mutual_friend_count(self, user1, user2):
+        """Return the number of friends ``user1`` and ``user2`` have in common"""
+        return len(self.mutual_friends(user1, user2))
+
+    async def amutual_friend_count(self, user1, user2):
+        """Async version of ``mutual_friend_count()``"""
+        return len(await self.amutual_friends(user1, user2))
+
+    def friends_of_friends(self, user, limit=None):
+        """Return up to ``limit`` friends of ``user``'s friends, ranked by the
+        number of friends they have in common with ``user``
+
+        ``user`` and their friends are left out. The ranking is computed with
+        one grouped join, cached, and busted when ``user``'s own friends
+        change; changes further out show up when the cached ranking expires.
+        ``limit`` defaults to ``FRIENDSHIP_PAGE_SIZE`` (50).
+        """
+        limit = _friends_of_friends_limit(limit)
+        key = cache_key("friends_of_friends", user.pk)
+
+        def compute():
+            return _ranking(_friends_of_friends(user, limit), limit)
+
+        timeout = cache_timeout("friends_of_friends")
+        ids = _cached_ranking(_get_or_compute(key, compute, timeout), limit)
+        if ids is None:
+            # The cached ranking was cut short at a lower limit
+            value = compute()
+            cache.set(key, value, timeout)
+            ids = _cached_ranking(value, limit)
+        return LazyUserList(ids, is_sorted=False)
+
+    async def afriends_of_friends(self, user, limit=None):
+        """Async version of ``friends_of_friends()``"""
+        limit = _friends_of_friends_limit(limit)
+        key = await acache_key("friends_of_friends", user.pk)
+
+        async def compute():
+            return _ranking(await _afriends_of_friends(user, limit), limit)
+
+        timeout = cache_timeout("friends_of_friends")
+        ids = _cached_ranking(await _aget_or_compute(key, compute, timeout), limit)
+        if ids is None:
+            value = await compute()
+            await cache.aset(key, value, timeout)
+            ids = _cached_ranking(value, limit)
+        return LazyUserList(ids, is_sorted=False)
+
+    def suggestions(self, user, limit=None):
+        """Return up to ``limit`` users ``user`` may know, best match first
+
+        Suggestions are precomputed and cached per user by
+        ``refresh_suggestions()`` (see the ``refresh_friend_suggestions``
+        management command). The suggestions of the users a write involves
+        are recomputed once it commits, if they are cached. A user without
+        cached suggestions gets them computed on the spot.
+        """
+        key = cache_key("suggestions", user.pk)
+        ids = _get_or_compute(
+            key,
+            lambda: _pack_ids(_compute_suggestions([user.pk])[user.pk], sort=False),
+            cache_timeout("suggestions"),
+        )
+        return LazyUserList(_unpack_ids(ids)[:limit], is_sorted=False)
+
+    async def asuggestions(self, user, limit=None):
+        """Async version of ``suggestions()``"""
+        key = await acache_key("suggestions", user.pk)
+
+        async def compute():
+            suggestions = await _acompute_suggestions([user.pk])
+            return _pack_ids(suggestions[user.pk], sort=False)
+
+        ids = await _aget_or_compute(key, compute, cache_timeout("suggestions"))
+        return LazyUserList(_unpack_ids(ids)[:limit], is_sorted=False)
+
+    def refresh_suggestions(self, users, batch_size=None):
+        """Recompute and cache the suggestions of ``users``
+
+        Users are processed ``batch_size`` (default 500) at a time, each batch
+        costing five queries and one ``set_many``. Returns the number of users
+        refreshed.
+        """
+        batch_size = batch_size or 500
+        user_pks = [getattr(user, "pk", user) for user in users]
+        for start in range(0, len(user_pks), batch_size):
+            batch = user_pks[start : start + batch_size]
+            suggestions = _compute_suggestions(batch)
+            keys = cache_keys(("suggestions", pk) for pk in batch)
+            cache.set_many(
+                {key: _pack_ids(suggestions[pk], sort=False) for key, pk in zip(keys, batch)},
+                cache_timeout("suggestions"),
+            )
+        return len(user_pks)
 
     def _friendship_request_select_related(self, qs, *fields):
         strategy = getattr(
@@ -394,6 +1746,12 @@ class Friend(models.Model):
         verbose_name = _("Friend")
         verbose_name_plural = _("Friends")
         unique_together = ("from_user", "to_user")
+        indexes = [
+            # Friend id sets, answered from the index alone
+            models.Index(fields=["to_user", "from_user"], name="friend_to_user_from_user_idx"),
+            # Friend pages, newest first
+            models.Index(fields=["to_user", "created", "id"], name="friend_to_user_created_idx"),
+        ]
 
     def __str__(self):
         return f"User #{self.to_user_id} is friends with #{self.from_user_id}"
@@ -410,27 +1768,56 @@ class FollowingManager(models.Manager):
 
     def followers(self, user):
         """Return a list of all followers"""
-        key = cache_key("followers", user.pk)
-        followers = cache.get(key)
+        return LazyUserList(_cached_ids("followers", user))
 
-        if followers is None:
-            qs = Follow.objects.filter(followee=user).select_related("follower")
-            followers = [u.follower for u in qs]
-            cache.set(key, followers)
+    async def afollowers(self, user):
+        """Async version of ``followers()``"""
+        return LazyUserList(await _acached_ids("followers", user))
 
-        return followers
+    def followers_page(self, user, cursor=None, limit=None):
+        """Return a ``RelationshipPage`` of followers, most recent first"""
+        qs = Follow.objects.filter(followee=user)
+        return _page("followers_page", user.pk, qs, "follower_id", cursor, limit)
+
+    async def afollowers_page(self, user, cursor=None, limit=None):
+        """Async version of ``followers_page()``"""
+        qs = Follow.objects.filter(followee=user)
+        return await _apage("followers_page", user.pk, qs, "follower_id", cursor, limit)
 
     def following(self, user):
         """Return a list of all users the given user follows"""
-        key = cache_key("following", user.pk)
-        following = cache.get(key)
+        return LazyUserList(_cached_ids("following", user))
+
+    async def afollowing(self, user):
+        """Async version of ``following()``"""
+        return LazyUserList(await _acached_ids("following", user))
+
+    def following_page(self, user, cursor=None, limit=None):
+        """Return a ``RelationshipPage`` of users the given user follows, most
+        recent first"""
+        qs = Follow.objects.filter(follower=user)
+        return _page("following_page", user.pk, qs, "followee_id", cursor, limit)
+
+    async def afollowing_page(self, user, cursor=None, limit=None):
+        """Async version of ``following_page()``"""
+        qs = Follow.objects.filter(follower=user)
+        return await _apage("following_page", user.pk, qs, "followee_id", cursor, limit)
+
+    def follower_count(self, user):
+        """Return the number of followers ``user`` has, from a cached counter"""
+        return _cached_count("followers", user)
+
+    async def afollower_count(self, user):
+        """Async version of ``follower_count()``"""
+        return await _acached_count("followers", user)
 
-        if following is None:
-            qs = Follow.objects.filter(follower=user).select_related("followee")
-            following = [u.followee for u in qs]
-            cache.set(key, following)
+    def following_count(self, user):
+        """Return the number of users ``user`` follows, from a cached counter"""
+        return _cached_count("following", user)
 
-        return following
+    async def afollowing_count(self, user):
+        """Async version of ``following_count()``"""
+        return await _acached_count("following", user)
 
     def add_follower(self, follower, followee):
         """Create 'follower' follows 'followee' relationship"""
@@ -446,11 +1833,45 @@ class FollowingManager(models.Manager):
         followee_created.send(sender=self.model, followee=followee)
         following_created.send(sender=self.model, following=relation)
 
-        bust_cache("followers", followee.pk)
-        bust_cache("following", follower.pk)
+        bust_caches([("followers", followee.pk), ("following", follower.pk)])
+        _adjust_counts([("followers", followee.pk, 1), ("following", follower.pk, 1)])
 
         return relation
 
+    async def aadd_follower(self, follower, followee):
+        """Async version of ``add_follower()``"""
+        return await sync_to_async(self.add_follower)(follower, followee)
+
+    def add_followers_many(self, pairs, batch_size=None):
+        """Create many 'follower' follows 'followee' relationships at once
+
+        ``pairs`` is an iterable of ``(follower, followee)`` tuples of users
+        or primary keys. Existing relationships are skipped rather than
+        raising ``AlreadyExistsError``. Returns the list of ``Follow`` rows
+        that were created, sends one ``followings_created`` signal and busts
+        the affected caches in one round trip.
+        """
+        pairs = list(pairs)
+        if any(follower == followee for follower, followee in pairs):
+            raise ValidationError("Users cannot follow themselves")
+
+        created = _bulk_create_pairs(Follow, "follower", "followee", pairs, batch_size)
+        if created:
+            followings_created.send(sender=self.model, followings=created)
+            bust_caches(
+                entry for rel in created for entry in (("followers", rel.followee_id), ("following", rel.follower_id))
+            )
+            _adjust_counts(
+                entry
+                for rel in created
+                for entry in (("followers", rel.followee_id, 1), ("following", rel.follower_id, 1))
+            )
+        return created
+
+    async def aadd_followers_many(self, pairs, batch_size=None):
+        """Async version of ``add_followers_many()``"""
+        return await sync_to_async(self.add_followers_many)(pairs, batch_size)
+
     def remove_follower(self, follower, followee):
         """Remove 'follower' follows 'followee' relationship"""
         try:
@@ -459,21 +1880,31 @@ class FollowingManager(models.Manager):
             followee_removed.send(sender=rel, followee=rel.followee)
             following_removed.send(sender=rel, following=rel)
             rel.delete()
-            bust_cache("followers", followee.pk)
-            bust_cache("following", follower.pk)
+            bust_caches([("followers", followee.pk), ("following", follower.pk)])
+            _adjust_counts([("followers", followee.pk, -1), ("following", follower.pk, -1)])
             return True
         except Follow.DoesNotExist:
             return False
 
+    async def aremove_follower(self, follower, followee):
+        """Async version of ``remove_follower()``"""
+        return await sync_to_async(self.remove_follower)(follower, followee)
+
     def follows(self, follower, followee):
         """Does follower follow followee? Smartly uses caches if exists"""
-        followers = cache.get(cache_key("following", follower.pk))
-        following = cache.get(cache_key("followers", followee.pk))
-
-        if followers and followee in followers or following and follower in following:
-            return True
-        else:
-            return Follow.objects.filter(follower=follower, followee=followee).exists()
+        cached = _cached_contains(("following", follower.pk, followee.pk), ("followers", followee.pk, follower.pk))
+        if cached is not None:
+            return cached
+        return Follow.objects.filter(follower=follower, followee=followee).exists()
+
+    async def afollows(self, follower, followee):
+        """Async version of ``follows()``"""
+        cached = await _acached_contains(
+            ("following", follower.pk, followee.pk), ("followers", followee.pk, follower.pk)
+        )
+        if cached is not None:
+            return cached
+        return await Follow.objects.filter(follower=follower, followee=followee).aexists()
 
 
 class Follow(models.Model):
@@ -489,6 +1920,13 @@ class Follow(models.Model):
         verbose_name = _("Following Relationship")
         verbose_name_plural = _("Following Relationships")
         unique_together = ("follower", "followee")
+        indexes = [
+            # Follower id sets, answered from the index alone
+            models.Index(fields=["followee", "follower"], name="follow_followee_follower_idx"),
+            # Follower and following pages, newest first
+            models.Index(fields=["followee", "created", "id"], name="follow_followee_created_idx"),
+            models.Index(fields=["follower", "created", "id"], name="follow_follower_created_idx"),
+        ]
 
     def __str__(self):
         return f"User #{self.follower_id} follows #{self.followee_id}"
@@ -505,27 +1943,35 @@ class BlockManager(models.Manager):
 
     def blocked(self, user):
         """Return a list of all blocks"""
-        key = cache_key("blocked", user.pk)
-        blocked = cache.get(key)
-
-        if blocked is None:
-            qs = Block.objects.filter(blocked=user).select_related("blocker")
-            blocked = [u.blocker for u in qs]
-            cache.set(key, blocked)
+        return LazyUserList(_cached_ids("blocked", user))
 
-        return blocked
+    async def ablocked(self, user):
+        """Async version of ``blocked()``"""
+        return LazyUserList(await _acached_ids("blocked", user))
 
     def blocking(self, user):
         """Return a list of all users the given user blocks"""
-        key = cache_key("blocking", user.pk)
-        blocking = cache.get(key)
+        return LazyUserList(_cached_ids("blocking", user))
+
+    async def ablocking(self, user):
+        """Async version of ``blocking()``"""
+        return LazyUserList(await _acached_ids("blocking", user))
 
-        if blocking is None:
-            qs = Block.objects.filter(blocker=user).select_related("blocked")
-            blocking = [u.blocked for u in qs]
-            cache.set(key, blocking)
+    def blocked_count(self, user):
+        """Return the number of users blocking ``user``, from a cached counter"""
+        return _cached_count("blocked", user)
 
-        return blocking
+    async def ablocked_count(self, user):
+        """Async version of ``blocked_count()``"""
+        return await _acached_count("blocked", user)
+
+    def blocking_count(self, user):
+        """Return the number of users ``user`` blocks, from a cached counter"""
+        return _cached_count("blocking", user)
+
+    async def ablocking_count(self, user):
+        """Async version of ``blocking_count()``"""
+        return await _acached_count("blocking", user)
 
     def add_block(self, blocker, blocked):
         """Create 'blocker' blocks 'blocked' relationship"""
@@ -541,11 +1987,43 @@ class BlockManager(models.Manager):
         block_created.send(sender=self.model, blocked=blocked)
         block_created.send(sender=self.model, blocking=relation)
 
-        bust_cache("blocked", blocked.pk)
-        bust_cache("blocking", blocker.pk)
+        bust_caches([("blocked", blocked.pk), ("blocking", blocker.pk)])
+        _adjust_counts([("blocked", blocked.pk, 1), ("blocking", blocker.pk, 1)])
 
         return relation
 
+    async def aadd_block(self, blocker, blocked):
+        """Async version of ``add_block()``"""
+        return await sync_to_async(self.add_block)(blocker, blocked)
+
+    def add_blocks_many(self, pairs, batch_size=None):
+        """Create many 'blocker' blocks 'blocked' relationships at once
+
+        ``pairs`` is an iterable of ``(blocker, blocked)`` tuples of users or
+        primary keys. Existing blocks are skipped rather than raising
+        ``AlreadyExistsError``. Returns the list of ``Block`` rows that were
+        created, sends one ``blocks_created`` signal and busts the affected
+        caches in one round trip.
+        """
+        pairs = list(pairs)
+        if any(blocker == blocked for blocker, blocked in pairs):
+            raise ValidationError("Users cannot block themselves")
+
+        created = _bulk_create_pairs(Block, "blocker", "blocked", pairs, batch_size)
+        if created:
+            blocks_created.send(sender=self.model, blockings=created)
+            bust_caches(
+                entry for rel in created for entry in (("blocked", rel.blocked_id), ("blocking", rel.blocker_id))
+            )
+            _adjust_counts(
+                entry for rel in created for entry in (("blocked", rel.blocked_id, 1), ("blocking", rel.blocker_id, 1))
+            )
+        return created
+
+    async def aadd_blocks_many(self, pairs, batch_size=None):
+        """Async version of ``add_blocks_many()``"""
+        return await sync_to_async(self.add_blocks_many)(pairs, batch_size)
+
     def remove_block(self, blocker, blocked):
         """Remove 'blocker' blocks 'blocked' relationship"""
         try:
@@ -554,23 +2032,34 @@ class BlockManager(models.Manager):
             block_removed.send(sender=rel, blocked=rel.blocked)
             block_removed.send(sender=rel, blocking=rel)
             rel.delete()
-            bust_cache("blocked", blocked.pk)
-            bust_cache("blocking", blocker.pk)
+            bust_caches([("blocked", blocked.pk), ("blocking", blocker.pk)])
+            _adjust_counts([("blocked", blocked.pk, -1), ("blocking", blocker.pk, -1)])
             return True
         except Block.DoesNotExist:
             return False
 
+    async def aremove_block(self, blocker, blocked):
+        """Async version of ``remove_block()``"""
+        return await sync_to_async(self.remove_block)(blocker, blocked)
+
     def is_blocked(self, user1, user2):
-        """Are these two users blocked?"""
-        block1 = cache.get(cache_key("blocks", user1.pk))
-        if block1 and user2 in block1:
-            return True
+        """Are these two users blocked?
 
-        block2 = cache.get(cache_key("blocks", user2.pk))
-        if block2 and user1 in block2:
-            return True
+        Each user's cached block set holds everyone they block or are blocked
+        by, so either one answers the question. When neither is cached,
+        ``user1``'s set is loaded and cached for the next check.
+        """
+        cached = _cached_contains(("blocks", user1.pk, user2.pk), ("blocks", user2.pk, user1.pk))
+        if cached is not None:
+            return cached
+        return _contains(_cached_ids("blocks", user1), user2.pk)
 
-        return Block.objects.filter(blocker__in=[user1, user2], blocked__in=[user1, user2]).exists()
+    async def ais_blocked(self, user1, user2):
+        """Async version of ``is_blocked()``"""
+        cached = await _acached_contains(("blocks", user1.pk, user2.pk), ("blocks", user2.pk, user1.pk))
+        if cached is not None:
+            return cached
+        return _contains(await _acached_ids("blocks", user1), user2.pk)
 
 
 class Block(models.Model):
@@ -586,6 +2075,10 @@ class Block(models.Model):
         verbose_name = _("Blocked Relationship")
         verbose_name_plural = _("Blocked Relationships")
         unique_together = ("blocker", "blocked")
+        indexes = [
+            # Blocker id sets, answered from the index alone
+            models.Index(fields=["blocked", "blocker"], name="block_blocked_blocker_idx"),
+        ]
 
     def __str__(self):
         return f"User #{self.blocker_id} blocks #{self.blocked_id}"
@@ -595,3 +2088,50 @@ class Block(models.Model):
         if self.blocker == self.blocked:
             raise ValidationError("Users cannot block themselves.")
         super().save(*args, **kwargs)
+
+
+# Keep cached suggestions current as relationships change
+@receiver(friendship_request_accepted)
+@receiver(friendship_removed)
+def _friendship_changed(sender, from_user, to_user, **kwargs):
+    _refresh_suggestions_on_commit([from_user.pk, to_user.pk])
+
+
+@receiver(friendships_imported)
+def _friendships_imported(sender, friendships, **kwargs):
+    _refresh_suggestions_on_commit({pk for f in friendships for pk in (f.from_user_id, f.to_user_id)})
+
+
+@receiver(friendship_request_created)
+@receiver(friendship_request_rejected)
+@receiver(friendship_request_canceled)
+def _request_changed(sender, **kwargs):
+    _refresh_suggestions_on_commit([sender.from_user_id, sender.to_user_id])
+
+
+@receiver(following_created)
+@receiver(following_removed)
+@receiver(followings_created)
+def _following_changed(sender, following=None, followings=(), **kwargs):
+    # Only the follower's ranking goes through whom they follow
+    followings = [following] if following is not None else followings
+    _refresh_suggestions_on_commit({rel.follower_id for rel in followings})
+
+
+@receiver(block_created)
+@receiver(block_removed)
+@receiver(blocks_created)
+def _blocking_changed(sender, blocking=None, blockings=(), **kwargs):
+    # add_block and remove_block also signal the blocker and blocked alone
+    blockings = [blocking] if blocking is not None else blockings
+    if blockings:
+        _refresh_suggestions_on_commit({pk for rel in blockings for pk in (rel.blocker_id, rel.blocked_id)})
+
+
+# Report the latency of the public API to FRIENDSHIP_METRICS
+metrics.instrument(FriendshipManager)
+metrics.instrument(FollowingManager)
+metrics.instrument(BlockManager)
+metrics.instrument(
+    FriendshipRequest, ["accept", "aaccept", "reject", "areject", "cancel", "acancel", "mark_viewed", "amark_viewed"]
+)
@@ -6,11 +6,14 @@ friendship_request_canceled = Signal()
 friendship_request_viewed = Signal()
 friendship_request_accepted = Signal()
 friendship_removed = Signal()
+friendships_imported = Signal()
 follower_created = Signal()
 follower_removed = Signal()
 followee_created = Signal()
 followee_removed = Signal()
 following_created = Signal()
 following_removed = Signal()
+followings_created = Signal()
 block_created = Signal()
 block_removed = Signal()
+blocks_created = Signal()
@@ -0,0 +1,206 @@
+import json
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from itertools import islice
+from mmap import ACCESS_READ, mmap
+
+from django.utils import timezone
+
+from friendship.models import Block, Follow, Friend
+
+SNAPSHOT_FORMAT = "django-friendship-graph"
+SNAPSHOT_VERSION = 1
+
+# Each table's edges run from the source user to the target user.
+EDGE_TABLES = {
+    "friends": (Friend, "to_user", "from_user"),
+    "follows": (Follow, "follower", "followee"),
+    "blocks": (Block, "blocker", "blocked"),
+}
+
+GraphTable = namedtuple("GraphTable", ["nodes", "indptr", "indices"])
+
+
+class GraphSnapshot(dict):
+    """
+    The ``GraphTable`` of each table of a snapshot, by table name
+
+    ``close()`` it, or use it as a context manager, to unmap the files once
+    done. Its arrays cannot be read afterwards, and slices taken from them
+    must be dropped first.
+    """
+
+    def __init__(self, tables, maps):
+        super().__init__(tables)
+        self._maps = maps
+
+    def close(self):
+        while self._maps:
+            view, mapped = self._maps.pop()
+            view.release()
+            mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def export_snapshot(path, chunk_size=10000):
+    """
+    Write the friend, follow and block graphs to the directory ``path``
+
+    Each table is stored in compressed sparse row (CSR) form as three files of
+    little-endian int64: the distinct source user ids (``<table>.nodes``), the
+    offset of each source's first edge plus a final end offset
+    (``<table>.indptr``) and the target user id of every edge
+    (``<table>.indices``). Rows are streamed in source order with
+    ``values_list(...).iterator()``, so no model is instantiated and only the
+    node arrays and one chunk of edges are held in memory. A ``manifest.json``
+    describes the files. Returns the manifest.
+    """
+    os.makedirs(path, exist_ok=True)
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "created": timezone.now().isoformat(),
+        "dtype": "<i8",
+        "tables": {},
+    }
+
+    for name, (model, source, target) in EDGE_TABLES.items():
+        rows = (
+            model.objects.order_by(f"{source}_id", f"{target}_id")
+            .values_list(f"{source}_id", f"{target}_id")
+            .iterator(chunk_size=chunk_size)
+        )
+        nodes, indptr, edges = array("q"), array("q", [0]), 0
+        with open(os.path.join(path, f"{name}.indices"), "wb") as f:
+            chunk = array("q")
+            try:
+                for source_pk, target_pk in rows:
+                    if not nodes or nodes[-1] != source_pk:
+                        if nodes:
+                            indptr.append(edges)
+                        nodes.append(source_pk)
+                    chunk.append(target_pk)
+                    edges += 1
+                    if len(chunk) == chunk_size:
+                        _write(f, chunk)
+                        chunk = array("q")
+            except TypeError:
+                raise ValueError("Graph snapshots require integer user primary keys") from None
+            _write(f, chunk)
+        if nodes:
+            indptr.append(edges)
+
+        for suffix, ids in (("nodes", nodes), ("indptr", indptr)):
+            with open(os.path.join(path, f"{name}.{suffix}"), "wb") as f:
+                _write(f, ids)
+
+        manifest["tables"][name] = {
+            "model": model._meta.label,
+            "source": source,
+            "target": target,
+            "nodes": len(nodes),
+            "edges": edges,
+        }
+
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_snapshot(path):
+    """
+    Return a ``GraphSnapshot`` of the tables in the snapshot at ``path``
+
+    On little-endian machines the arrays are int64 ``memoryview``s over
+    memory-mapped files, so even a large graph is paged in on demand. The
+    files can equally be opened with ``numpy.memmap(..., dtype="<i8")``.
+    """
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} friendship graph snapshot")
+
+    maps = []
+    tables = {
+        name: GraphTable(*(_read(os.path.join(path, f"{name}.{suffix}"), maps) for suffix in GraphTable._fields))
+        for name in manifest["tables"]
+    }
+    return GraphSnapshot(tables, maps)
+
+
+def import_snapshot(path, batch_size=1000):
+    """
+    Bulk-import the snapshot at ``path``, skipping relationships that exist
+
+    Edges are fed ``batch_size`` at a time to
+    ``Friend.objects.import_friendships()``, ``Follow.objects.add_followers_many()``
+    and ``Block.objects.add_blocks_many()``, so caches, counters and bulk
+    signals are handled as for any other bulk write. Returns the number of rows
+    created per table.
+    """
+    importers = {
+        "friends": Friend.objects.import_friendships,
+        "follows": Follow.objects.add_followers_many,
+        "blocks": Block.objects.add_blocks_many,
+    }
+    created = {}
+    with read_snapshot(path) as snapshot:
+        for name, table in snapshot.items():
+            edges = _edges(table)
+            if name == "friends":
+                # Friendships may be stored in both directions and are imported once
+                edges = ((a, b) for a, b in edges if a < b or not _has_edge(table, b, a))
+            created[name] = 0
+            while batch := list(islice(edges, batch_size)):
+                created[name] += len(importers[name](batch, batch_size))
+    return created
+
+
+def _write(f, ids):
+    if sys.byteorder != "little":
+        ids = array("q", ids)
+        ids.byteswap()
+    ids.tofile(f)
+
+
+def _read(path, maps):
+    """
+    Read the int64 array at ``path``, recording the ``(view, mmap)`` pair of a
+    memory-mapped file in ``maps``
+    """
+    with open(path, "rb") as f:
+        if sys.byteorder == "little" and os.fstat(f.fileno()).st_size:
+            mapped = mmap(f.fileno(), 0, access=ACCESS_READ)
+            view = memoryview(mapped).cast("q")
+            maps.append((view, mapped))
+            return view
+        ids = array("q")
+        ids.frombytes(f.read())
+        if sys.byteorder != "little":
+            ids.byteswap()
+        return ids
+
+
+def _edges(table):
+    nodes, indptr, indices = table
+    for i, source in enumerate(nodes):
+        for target in indices[indptr[i] : indptr[i + 1]]:
+            yield source, target
+
+
+def _has_edge(table, source, target):
+    nodes, indptr, indices = table
+    i = bisect_left(nodes, source)
+    if i == len(nodes) or nodes[i] != source:
+        return False
+    targets = indices[indptr[i] : indptr[i + 1]]
+    j = bisect_left(targets, target)
+    return j < len(targets) and targets[j] == target
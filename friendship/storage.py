@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+
+
+def _mirror(friend_model):
+    return friend_model.objects.filter(from_user_id=OuterRef("to_user_id"), to_user_id=OuterRef("from_user_id"))
+
+
+def _next_batch(queryset, batch_size, last_pk):
+    """
+    Return the next ``batch_size`` rows of ``queryset`` after ``last_pk``, in
+    primary key order
+
+    Paging on the primary key rather than an offset means rows the caller
+    rewrites out of ``queryset`` are neither skipped nor visited twice.
+    """
+    if last_pk is not None:
+        queryset = queryset.filter(pk__gt=last_pk)
+    return list(queryset.order_by("pk")[:batch_size])
+
+
+def convert_to_undirected(friend_model, batch_size=1000):
+    """
+    Rewrite mirrored ``Friend`` rows as one canonical row per friendship, from
+    the lower to the higher user primary key
+
+    The row pointing downwards is deleted when its mirror exists and flipped
+    when it does not. Rows are converted ``batch_size`` at a time, one short
+    transaction per batch, so the table is never locked for the whole run and
+    an interrupted conversion can simply be started again. Returns the number
+    of rows deleted and flipped.
+    """
+    deleted = flipped = 0
+    downwards = friend_model.objects.filter(from_user_id__gt=F("to_user_id")).annotate(
+        mirrored=Exists(_mirror(friend_model))
+    )
+    last_pk = None
+    while True:
+        with transaction.atomic():
+            batch = _next_batch(downwards, batch_size, last_pk)
+            if not batch:
+                break
+            mirrored = [friend.pk for friend in batch if friend.mirrored]
+            if mirrored:
+                deleted += friend_model.objects.filter(pk__in=mirrored).delete()[0]
+            unmirrored = [friend for friend in batch if not friend.mirrored]
+            for friend in unmirrored:
+                friend.from_user_id, friend.to_user_id = friend.to_user_id, friend.from_user_id
+            friend_model.objects.bulk_update(unmirrored, ["from_user", "to_user"])
+            flipped += len(unmirrored)
+        last_pk = batch[-1].pk
+    return deleted, flipped
+
+
+def convert_to_mirrored(friend_model, batch_size=1000):
+    """
+    Insert the missing mirror of every ``Friend`` row, undoing
+    ``convert_to_undirected``, ``batch_size`` rows per transaction. Returns the
+    number of rows inserted.
+    """
+    inserted = 0
+    unmirrored = friend_model.objects.filter(~Exists(_mirror(friend_model)))
+    last_pk = None
+    while True:
+        with transaction.atomic():
+            batch = _next_batch(unmirrored, batch_size, last_pk)
+            if not batch:
+                break
+            mirrors = [
+                friend_model(from_user_id=friend.to_user_id, to_user_id=friend.from_user_id, created=friend.created)
+                for friend in batch
+            ]
+            inserted += len(friend_model.objects.bulk_create(mirrors, ignore_conflicts=True))
+        last_pk = batch[-1].pk
+    return inserted
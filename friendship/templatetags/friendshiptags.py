@@ -72,7 +72,7 @@ def friend_count(user):
     """
     Inclusion tag to display the total count of friends for the given user
     """
-    return {"friend_count": len(Friend.objects.friends(user))}
+    return {"friend_count": Friend.objects.friend_count(user)}
 
 
 @register.inclusion_tag("friendship/templatetags/friend_rejected_count.html")
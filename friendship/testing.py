@@ -0,0 +1,81 @@
+from contextlib import contextmanager
+
+from friendship.cache import FriendshipCache
+
+# The cache backend methods that each cost one round trip
+CACHE_METHODS = [
+    "get",
+    "get_many",
+    "set",
+    "set_many",
+    "add",
+    "incr",
+    "decr",
+    "delete",
+    "delete_many",
+    "aget",
+    "aget_many",
+    "aset",
+    "aset_many",
+    "aadd",
+    "aincr",
+    "adecr",
+    "adelete",
+    "adelete_many",
+]
+
+
+class _RecordingBackend:
+    """A cache backend proxy that records the name of each round trip"""
+
+    def __init__(self, backend, calls):
+        self._backend = backend
+        self._calls = calls
+
+    def __getattr__(self, name):
+        attr = getattr(self._backend, name)
+        if name not in CACHE_METHODS:
+            return attr
+
+        def recording(*args, **kwargs):
+            self._calls.append(name)
+            return attr(*args, **kwargs)
+
+        return recording
+
+
+@contextmanager
+def capture_cache_calls():
+    """
+    Record the calls made to the friendship cache backend for the duration of
+    the block
+
+    Yields a list that receives the name of each backend method as it is
+    called. Only the round trips ``friendship`` makes through its cache are
+    recorded, so other uses of the same backend do not interfere, while reads
+    answered by ``request_cache()`` or skipped by an ``invalidation_buffer()``
+    are not counted. Calls made from other threads, such as the async API's,
+    are recorded too.
+    """
+    calls = []
+    backend = FriendshipCache.backend
+    FriendshipCache.backend = property(lambda cache: _RecordingBackend(backend.fget(cache), calls))
+    try:
+        yield calls
+    finally:
+        FriendshipCache.backend = backend
+
+
+class FriendshipTestMixin:
+    """
+    ``TestCase`` mixin that adds ``assertNumCacheCalls``, the friendship cache
+    counterpart of ``assertNumQueries``
+    """
+
+    @contextmanager
+    def assertNumCacheCalls(self, num):
+        with capture_cache_calls() as calls:
+            yield calls
+        self.assertEqual(
+            len(calls), num, f"{len(calls)} friendship cache calls were made, {num} expected: {', '.join(calls)}"
+        )
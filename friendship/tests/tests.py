@@ -1,21 +1,52 @@
+import csv
+import importlib
+import json
 import os
-from unittest import mock
-
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.cache import cache
+from django.core.cache import cache, caches
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError
-from django.test import TestCase, override_settings
-from django.urls import reverse
-
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import clear_url_caches, resolve, reverse
+
+import friendship.urls
+from friendship import async_views, views
+from friendship.cache import invalidation_buffer, request_cache
 from friendship.exceptions import AlreadyExistsError, AlreadyFriendsError, MaxFriendsExceededError
-from friendship.models import Block, Follow, Friend, FriendshipRequest
+from friendship.export import export_lines
+from friendship.metrics import MetricsCollector
+from friendship.middleware import InvalidationBufferMiddleware
+from friendship.models import (
+    Block,
+    Follow,
+    Friend,
+    FriendshipRequest,
+    LazyModelList,
+    RelationshipStatus,
+    cache_key,
+    cache_timeout,
+    relationship_status_many,
+)
 from friendship.signals import (
     block_created,
     followee_created,
     follower_created,
     following_created,
+    followings_created,
 )
+from friendship.snapshot import read_snapshot
+from friendship.testing import FriendshipTestMixin
 
 TEST_TEMPLATES = os.path.join(os.path.dirname(__file__), "templates")
 
@@ -33,6 +64,12 @@ class login:
         self.testcase.client.logout()
 
 
+def reload_urlconf():
+    importlib.reload(friendship.urls)
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
 class BaseTestCase(TestCase):
     def setUp(self):
         """
@@ -277,6 +314,284 @@ class FriendshipModelTests(BaseTestCase):
         with self.assertRaises(ValidationError):
             Block.objects.create(blocker=self.user_bob, blocked=self.user_bob)
 
+    def test_relationship_caches_store_primary_keys(self):
+        Follow.objects.add_follower(self.user_steve, self.user_bob)
+        Follow.objects.add_follower(self.user_amy, self.user_bob)
+
+        followers = Follow.objects.followers(self.user_bob)
+        self.assertIsInstance(cache.get(cache_key("followers", self.user_bob.pk)), bytes)
+
+        # Length, truthiness and membership are answered without loading users
+        with self.assertNumQueries(0):
+            followers = Follow.objects.followers(self.user_bob)
+            self.assertEqual(len(followers), 2)
+            self.assertTrue(followers)
+            self.assertIn(self.user_amy, followers)
+            self.assertNotIn(self.user_susan, followers)
+
+        # Users are hydrated in one query, in primary key order
+        with self.assertNumQueries(1):
+            self.assertEqual(list(followers), sorted([self.user_steve, self.user_amy], key=lambda u: u.pk))
+
+    def test_membership_checks_use_cached_ids(self):
+        Friend.objects.add_friend(self.user_bob, self.user_steve).accept()
+        Follow.objects.add_follower(self.user_bob, self.user_amy)
+
+        # Cold caches fall back to a single EXISTS query
+        with self.assertNumQueries(1):
+            self.assertTrue(Friend.objects.are_friends(self.user_bob, self.user_steve))
+        with self.assertNumQueries(1):
+            self.assertTrue(Follow.objects.follows(self.user_bob, self.user_amy))
+
+        # Either side's cached ids answer the question, positive or negative
+        Friend.objects.friends(self.user_steve)
+        Follow.objects.followers(self.user_amy)
+        with self.assertNumQueries(0):
+            self.assertTrue(Friend.objects.are_friends(self.user_bob, self.user_steve))
+            self.assertFalse(Friend.objects.are_friends(self.user_amy, self.user_steve))
+            self.assertTrue(Follow.objects.follows(self.user_bob, self.user_amy))
+            self.assertFalse(Follow.objects.follows(self.user_susan, self.user_amy))
+
+    def test_relationship_pages(self):
+        for user in (self.user_steve, self.user_susan, self.user_amy):
+            Follow.objects.add_follower(user, self.user_bob)
+
+        page = Follow.objects.followers_page(self.user_bob, limit=2)
+        self.assertEqual(list(page.users), [self.user_amy, self.user_susan])
+        self.assertIsNotNone(page.next_cursor)
+
+        page = Follow.objects.followers_page(self.user_bob, cursor=page.next_cursor, limit=2)
+        self.assertEqual(list(page.users), [self.user_steve])
+        self.assertIsNone(page.next_cursor)
+
+        with self.assertRaises(ValueError):
+            Follow.objects.followers_page(self.user_bob, cursor="not-a-cursor")
+
+        # The first page at the default size is cached as a window of ids
+        with self.settings(FRIENDSHIP_PAGE_SIZE=2):
+            Follow.objects.followers_page(self.user_bob)
+            with self.assertNumQueries(0):
+                page = Follow.objects.followers_page(self.user_bob)
+                self.assertIn(self.user_amy, page.users)
+
+            Follow.objects.remove_follower(self.user_amy, self.user_bob)
+            page = Follow.objects.followers_page(self.user_bob)
+            self.assertEqual(list(page.users), [self.user_susan, self.user_steve])
+
+    def test_relationship_status_many(self):
+        Friend.objects.add_friend(self.user_bob, self.user_steve).accept()
+        Friend.objects.add_friend(self.user_bob, self.user_susan)
+        Friend.objects.add_friend(self.user_amy, self.user_bob)
+        Follow.objects.add_follower(self.user_bob, self.user_amy)
+        Follow.objects.add_follower(self.user_susan, self.user_bob)
+        Block.objects.add_block(self.user_bob, self.user_susan)
+        users = [self.user_steve, self.user_susan, self.user_amy]
+
+        # Cold: one query per relation type plus one for requests, each
+        # narrowed down to users, and bob's full id sets are not cached
+        with self.assertNumQueries(6):
+            statuses = relationship_status_many(self.user_bob, users)
+        self.assertIsNone(cache.get(cache_key("friends", self.user_bob.pk)))
+
+        self.assertEqual(
+            statuses[self.user_steve.pk],
+            RelationshipStatus(True, False, False, False, False, False, False),
+        )
+        self.assertEqual(
+            statuses[self.user_susan.pk],
+            RelationshipStatus(False, False, True, True, False, True, False),
+        )
+        self.assertEqual(
+            statuses[self.user_amy.pk],
+            RelationshipStatus(False, True, False, False, False, False, True),
+        )
+
+        # Warm: nothing but the single get_many
+        Friend.objects.friends(self.user_bob)
+        Follow.objects.following(self.user_bob)
+        Follow.objects.followers(self.user_bob)
+        Block.objects.blocking(self.user_bob)
+        Block.objects.blocked(self.user_bob)
+        Friend.objects.requests(self.user_bob)
+        Friend.objects.sent_requests(self.user_bob)
+        with self.assertNumQueries(0):
+            self.assertEqual(relationship_status_many(self.user_bob, users), statuses)
+
+    def test_lazy_lists_drop_deleted_rows(self):
+        Friend.objects.add_friend(self.user_bob, self.user_steve).accept()
+        Friend.objects.add_friend(self.user_bob, self.user_susan).accept()
+        Friend.objects.friends(self.user_bob)
+        susan_pk = self.user_susan.pk
+        # The cascade deletes susan's friendships without busting bob's cache
+        self.user_susan.delete()
+
+        friends = Friend.objects.friends(self.user_bob)
+        self.assertEqual(len(friends), 2)
+        self.assertEqual(list(friends), [self.user_steve])
+        self.assertEqual(len(friends), 1)
+        self.assertNotIn(susan_pk, friends)
+
+        with self.assertRaises(TypeError):
+            LazyModelList([])
+
+    def test_bulk_writes(self):
+        Follow.objects.add_follower(self.user_bob, self.user_steve)
+        self.assertEqual(len(Follow.objects.following(self.user_bob)), 1)
+
+        created = Follow.objects.add_followers_many(
+            [(self.user_bob, self.user_steve), (self.user_bob, self.user_amy), (self.user_bob, self.user_susan)]
+        )
+        self.assertEqual({f.followee for f in created}, {self.user_amy, self.user_susan})
+        self.assertEqual(len(Follow.objects.following(self.user_bob)), 3)
+        self.assertEqual(Follow.objects.add_followers_many([(self.user_bob, self.user_amy)]), [])
+
+        created = Block.objects.add_blocks_many([(self.user_amy, self.user_steve), (self.user_amy, self.user_susan)])
+        self.assertEqual(len(created), 2)
+        self.assertTrue(Block.objects.is_blocked(self.user_steve, self.user_amy))
+
+        Friend.objects.friends(self.user_susan)
+        created = Friend.objects.import_friendships([(self.user_susan, self.user_amy)])
+        self.assertEqual(len(created), 2)
+        self.assertEqual(Friend.objects.friends(self.user_susan), [self.user_amy])
+        self.assertEqual(Friend.objects.friends(self.user_amy), [self.user_susan])
+        self.assertEqual(Friend.objects.import_friendships([(self.user_amy, self.user_susan)]), [])
+
+        with self.assertRaises(ValidationError):
+            Follow.objects.add_followers_many([(self.user_bob, self.user_bob)])
+
+    def test_bulk_writes_skip_concurrent_rows(self):
+        bulk_create = Follow.objects.bulk_create
+
+        def concurrent_bulk_create(objs, **kwargs):
+            # Another request follows amy between the caller's checks and the insert
+            Follow.objects.create(follower=self.user_steve, followee=self.user_amy)
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(Follow.objects, "bulk_create", side_effect=concurrent_bulk_create):
+            created = Follow.objects.add_followers_many(
+                [(self.user_steve, self.user_amy), (self.user_steve, self.user_susan)]
+            )
+        self.assertEqual([f.followee for f in created], [self.user_susan])
+        self.assertEqual(created[0], Follow.objects.get(follower=self.user_steve, followee=self.user_susan))
+
+    def test_cached_counters(self):
+        self.assertEqual(Friend.objects.friend_count(self.user_bob), 0)
+        self.assertEqual(Follow.objects.follower_count(self.user_amy), 0)
+        self.assertEqual(Block.objects.blocking_count(self.user_bob), 0)
+
+        keys = [
+            cache_key("friend_count", self.user_bob.pk),
+            cache_key("follower_count", self.user_amy.pk),
+            cache_key("blocking_count", self.user_bob.pk),
+        ]
+        with self.captureOnCommitCallbacks() as callbacks:
+            Friend.objects.add_friend(self.user_steve, self.user_bob).accept()
+            Follow.objects.add_follower(self.user_bob, self.user_amy)
+            Follow.objects.add_followers_many([(self.user_steve, self.user_amy)])
+            Block.objects.add_block(self.user_bob, self.user_susan)
+
+            # The writing transaction counts the rows it sees, and does not
+            # cache the counts its commit is yet to adjust
+            with self.assertNumQueries(3):
+                self.assertEqual(Friend.objects.friend_count(self.user_bob), 1)
+                self.assertEqual(Follow.objects.follower_count(self.user_amy), 2)
+                self.assertEqual(Block.objects.blocking_count(self.user_bob), 1)
+            self.assertEqual(cache.get_many(keys), {})
+
+        # Counters a concurrent reader cached before the commit are adjusted
+        # with incr/decr once it commits
+        cache.set_many(dict.fromkeys(keys, 0))
+        for callback in callbacks:
+            callback()
+        with self.assertNumQueries(0):
+            self.assertEqual(Friend.objects.friend_count(self.user_bob), 1)
+            self.assertEqual(Follow.objects.follower_count(self.user_amy), 2)
+            self.assertEqual(Block.objects.blocking_count(self.user_bob), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Friend.objects.remove_friend(self.user_bob, self.user_steve)
+            Follow.objects.remove_follower(self.user_bob, self.user_amy)
+        self.assertEqual(Friend.objects.friend_count(self.user_bob), 0)
+        self.assertEqual(Follow.objects.follower_count(self.user_amy), 1)
+
+        # A rolled back write leaves the counters alone
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            Follow.objects.add_follower(self.user_susan, self.user_amy)
+            transaction.set_rollback(True)
+        self.assertEqual(Follow.objects.follower_count(self.user_amy), 1)
+
+        # A counter missing when the write commits is deleted rather than left
+        # with a count read before the commit
+        Follow.objects.following_count(self.user_susan)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Follow.objects.add_follower(self.user_susan, self.user_steve)
+        cache.delete(cache_key("following_count", self.user_susan.pk))
+        cache.set(cache_key("following_count", self.user_susan.pk), 0)
+        with mock.patch.object(cache, "incr", side_effect=ValueError):
+            callbacks[-1]()
+        self.assertEqual(Follow.objects.following_count(self.user_susan), 1)
+
+        # Uncached counters are counted from the database
+        self.assertEqual(Friend.objects.friend_count(self.user_steve), 0)
+        self.assertEqual(Follow.objects.following_count(self.user_steve), 1)
+        self.assertEqual(Block.objects.blocked_count(self.user_susan), 1)
+
+    def test_is_blocked_uses_block_cache(self):
+        Block.objects.add_block(self.user_bob, self.user_steve)
+        Block.objects.add_block(self.user_amy, self.user_bob)
+
+        # A cold check loads and caches bob's blocks in both directions
+        with self.assertNumQueries(1):
+            self.assertTrue(Block.objects.is_blocked(self.user_bob, self.user_steve))
+        with self.assertNumQueries(0):
+            self.assertTrue(Block.objects.is_blocked(self.user_steve, self.user_bob))
+            self.assertTrue(Block.objects.is_blocked(self.user_amy, self.user_bob))
+            self.assertFalse(Block.objects.is_blocked(self.user_bob, self.user_susan))
+
+        Block.objects.remove_block(self.user_amy, self.user_bob)
+        self.assertFalse(Block.objects.is_blocked(self.user_bob, self.user_amy))
+        Block.objects.add_block(self.user_susan, self.user_bob)
+        self.assertTrue(Block.objects.is_blocked(self.user_bob, self.user_susan))
+
+    def test_mutual_friends(self):
+        Friend.objects.import_friendships(
+            [
+                (self.user_bob, self.user_steve),
+                (self.user_bob, self.user_susan),
+                (self.user_amy, self.user_steve),
+                (self.user_amy, self.user_susan),
+            ]
+        )
+        self.assertEqual(
+            list(Friend.objects.mutual_friends(self.user_bob, self.user_amy)), [self.user_steve, self.user_susan]
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(Friend.objects.mutual_friend_count(self.user_bob, self.user_amy), 2)
+        self.assertEqual(Friend.objects.mutual_friend_count(self.user_bob, self.user_steve), 0)
+
+        Friend.objects.remove_friend(self.user_amy, self.user_susan)
+        self.assertEqual(list(Friend.objects.mutual_friends(self.user_bob, self.user_amy)), [self.user_steve])
+
+    def test_friends_of_friends(self):
+        user_joe = self.create_user("joe", "joe@joe.com", self.user_pw)
+        Friend.objects.import_friendships(
+            [
+                (self.user_bob, self.user_steve),
+                (self.user_bob, self.user_susan),
+                (self.user_amy, self.user_steve),
+                (self.user_amy, self.user_susan),
+                (user_joe, self.user_susan),
+                (self.user_steve, self.user_susan),
+            ]
+        )
+        self.assertEqual(list(Friend.objects.friends_of_friends(self.user_bob)), [self.user_amy, user_joe])
+        with self.assertNumQueries(0):
+            self.assertEqual(list(Friend.objects.friends_of_friends(self.user_bob, limit=1).ids), [self.user_amy.pk])
+
+        # Cached rankings are busted with the user's friends
+        Friend.objects.import_friendships([(self.user_bob, self.user_amy)])
+        self.assertEqual(list(Friend.objects.friends_of_friends(self.user_bob)), [user_joe])
+
 
 class FriendshipViewTests(BaseTestCase):
     def setUp(self):
@@ -311,6 +626,117 @@ class FriendshipViewTests(BaseTestCase):
             self.assertResponse200(response)
             self.assertTrue("object" in response.context)
 
+    def test_friendship_view_friends_paginated(self):
+        self.friendship_request.accept()
+        url = reverse("friendship_view_friends", kwargs={"username": self.user_bob.username})
+
+        with self.settings(FRIENDSHIP_PAGINATE_VIEWS=True, FRIENDSHIP_PAGE_SIZE=1):
+            response = self.client.get(url)
+            self.assertResponse200(response)
+            self.assertEqual(list(response.context["friends"]), [self.user_steve])
+            self.assertIsNone(response.context["next_cursor"])
+
+            response = self.client.get(url, {"cursor": "bogus"})
+            self.assertResponse404(response)
+
+    def test_paginated_views_link_to_the_next_page(self):
+        self.friendship_request.accept()
+        Friend.objects.add_friend(self.user_bob, self.user_susan).accept()
+        Follow.objects.add_follower(self.user_steve, self.user_bob)
+        Follow.objects.add_follower(self.user_susan, self.user_bob)
+        Follow.objects.add_follower(self.user_bob, self.user_steve)
+        Follow.objects.add_follower(self.user_bob, self.user_susan)
+        kwargs = {"username": self.user_bob.username}
+
+        with self.settings(FRIENDSHIP_PAGINATE_VIEWS=True, FRIENDSHIP_PAGE_SIZE=1):
+            for name, context_name in (
+                ("friendship_view_friends", "friends"),
+                ("friendship_followers", "followers"),
+                ("friendship_following", "following"),
+            ):
+                with self.subTest(name):
+                    url = reverse(name, kwargs=kwargs)
+                    response = self.client.get(url)
+                    self.assertEqual(list(response.context[context_name]), [self.user_susan])
+                    next_url = url + "?cursor=" + response.context["next_cursor"]
+                    self.assertContains(response, f'href="?cursor={response.context["next_cursor"]}" rel="next"')
+
+                    response = self.client.get(next_url)
+                    self.assertEqual(list(response.context[context_name]), [self.user_steve])
+                    self.assertIsNone(response.context["next_cursor"])
+                    self.assertNotContains(response, 'rel="next"')
+
+    def streamed(self, response):
+        if not response.is_async:
+            return b"".join(response.streaming_content)
+
+        async def collect():
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        return async_to_sync(collect)()
+
+    def test_export_relationships(self):
+        self.friendship_request.accept()
+        Friend.objects.add_friend(self.user_bob, self.user_amy, message="hi")
+        url = reverse("friendship_export", kwargs={"kind": "friends", "format": "csv"})
+
+        # test that the view requires authentication to access it
+        response = self.client.get(url)
+        self.assertResponse302(response)
+
+        with self.login(self.user_bob.username, self.user_pw):
+            response = self.client.get(url)
+            self.assertResponse200(response)
+            self.assertEqual(response["Content-Disposition"], 'attachment; filename="friends.csv"')
+            lines = self.streamed(response).decode().splitlines()
+            self.assertEqual(lines[0], "user_id,username,created")
+            self.assertEqual([line.split(",")[:2] for line in lines[1:]], [[str(self.user_steve.pk), "steve"]])
+
+            url = reverse("friendship_export", kwargs={"kind": "requests", "format": "jsonl"})
+            response = self.client.get(url)
+            self.assertEqual(response["Content-Type"], "application/x-ndjson")
+            rows = [json.loads(line) for line in self.streamed(response).splitlines()]
+            self.assertEqual([(row["to_username"], row["message"]) for row in rows], [("amy", "hi")])
+
+            url = reverse("friendship_export", kwargs={"kind": "blockers", "format": "csv"})
+            self.assertResponse404(self.client.get(url))
+
+    def test_export_kinds(self):
+        Follow.objects.add_follower(self.user_steve, self.user_bob)
+        Follow.objects.add_follower(self.user_bob, self.user_amy)
+        Block.objects.add_block(self.user_bob, self.user_susan)
+        # Who blocks bob is not bob's to export
+        Block.objects.add_block(self.user_amy, self.user_bob)
+
+        with self.login(self.user_bob.username, self.user_pw):
+            for kind, username in (("followers", "steve"), ("following", "amy"), ("blocking", "susan")):
+                with self.subTest(kind):
+                    url = reverse("friendship_export", kwargs={"kind": kind, "format": "csv"})
+                    lines = self.streamed(self.client.get(url)).decode().splitlines()
+                    self.assertEqual(lines[0], "user_id,username,created")
+                    self.assertEqual([line.split(",")[1] for line in lines[1:]], [username])
+
+    @override_settings(FRIENDSHIP_UNDIRECTED_STORAGE=True)
+    def test_export_undirected_friends(self):
+        self.friendship_request.accept()
+        Friend.objects.add_friend(self.user_amy, self.user_bob).accept()
+
+        # bob has the lowest pk, so he is the from_user of both canonical rows
+        for user, friends in ((self.user_bob, ["steve", "amy"]), (self.user_steve, ["bob"])):
+            with self.subTest(user.username):
+                lines = list(export_lines("friends", user, format="jsonl"))
+                self.assertEqual([json.loads(line)["username"] for line in lines], friends)
+
+    def test_export_escapes_formulas(self):
+        Friend.objects.add_friend(self.user_bob, self.user_amy, message="=HYPERLINK(1)")
+        Friend.objects.add_friend(self.user_bob, self.user_susan, message="-2+3")
+
+        lines = list(csv.reader(export_lines("requests", self.user_bob)))
+        self.assertEqual([row[5] for row in lines[1:]], ["", "'=HYPERLINK(1)", "'-2+3"])
+        # JSON lines are not opened by spreadsheets and are left alone
+        rows = [json.loads(line) for line in export_lines("requests", self.user_bob, format="jsonl")]
+        self.assertEqual(rows[1]["message"], "=HYPERLINK(1)")
+
     def test_friendship_add_friend(self):
         url = reverse("friendship_add_friend", kwargs={"to_username": self.user_amy.username})
 
@@ -637,6 +1063,25 @@ class FriendshipViewTests(BaseTestCase):
             self.assertTrue(redirect_url in response["Location"])
 
 
+@override_settings(FRIENDSHIP_ASYNC_VIEWS=True)
+class AsyncFriendshipViewTests(FriendshipViewTests):
+    """Run every view test against the async views"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        reload_urlconf()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        reload_urlconf()
+
+    def test_views_are_async(self):
+        match = resolve(reverse("friendship_view_friends", kwargs={"username": self.user_bob.username}))
+        self.assertTrue(iscoroutinefunction(match.func))
+
+
 class SignalTests(BaseTestCase):
     """
     Signals should be sent with ``sender`` set to the model class so that
@@ -667,6 +1112,14 @@ class SignalTests(BaseTestCase):
         self.assertEqual(followees[0]["followee"], self.user_steve)
         self.assertEqual(len(followings), 1)
 
+    def test_bulk_signals_fire_once_per_batch(self):
+        followings = self._collect(followings_created, Follow)
+
+        Follow.objects.add_followers_many([(self.user_bob, self.user_steve), (self.user_bob, self.user_amy)])
+
+        self.assertEqual(len(followings), 1)
+        self.assertEqual(len(followings[0]["followings"]), 2)
+
     def test_block_created_signals_fire_with_model_sender(self):
         blocks = self._collect(block_created, Block)
 
@@ -833,6 +1286,940 @@ class MaxFriendsTests(BaseTestCase):
             req.accept()
         self.assertFalse(Friend.objects.are_friends(self.user_bob, self.user_susan))
 
+    @override_settings(FRIENDSHIP_MAX_FRIENDS=5)
+    def test_accept_is_atomic(self):
+        req = Friend.objects.add_friend(self.user_bob, self.user_susan)
+        with (
+            mock.patch("friendship.models.friendship_request_accepted.send", side_effect=RuntimeError),
+            self.assertRaises(RuntimeError),
+        ):
+            req.accept()
+        # Neither Friend row survives a failure part way through
+        self.assertFalse(Friend.objects.filter(to_user__in=[self.user_bob, self.user_susan]).exists())
+        self.assertTrue(FriendshipRequest.objects.filter(pk=req.pk).exists())
+
+        # savepoint, lock, one grouped count, one insert, one delete, release
+        with self.assertNumQueries(6):
+            req.accept()
+        self.assertTrue(Friend.objects.are_friends(self.user_bob, self.user_susan))
+        self.assertIsNone(req.pk)
+
+
+class FriendshipRequestInboxTests(BaseTestCase):
+    def test_projections_share_one_cached_inbox(self):
+        Friend.objects.add_friend(self.user_bob, self.user_amy)
+        Friend.objects.add_friend(self.user_steve, self.user_amy).mark_viewed()
+        Friend.objects.add_friend(self.user_susan, self.user_amy).reject()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(Friend.objects.unread_request_count(self.user_amy), 2)
+            self.assertEqual(Friend.objects.unrejected_request_count(self.user_amy), 2)
+            self.assertEqual(len(Friend.objects.requests(self.user_amy)), 3)
+            self.assertEqual(len(Friend.objects.read_requests(self.user_amy)), 1)
+            self.assertEqual(len(Friend.objects.rejected_requests(self.user_amy)), 1)
+
+        # Iterating a projection loads the requests and their users in one query
+        with self.assertNumQueries(1):
+            unread = Friend.objects.unread_requests(self.user_amy)
+            self.assertEqual([r.from_user for r in unread], [self.user_bob, self.user_susan])
+
+
+class StampedeProtectionTests(BaseTestCase):
+    def test_lock_is_released_after_recompute(self):
+        Follow.objects.followers(self.user_bob)
+        key = cache_key("followers", self.user_bob.pk)
+        self.assertIsNotNone(cache.get(key))
+        self.assertIsNone(cache.get(f"{key}:lock"))
+
+    def test_waiters_use_the_lock_holders_result(self):
+        Follow.objects.add_follower(self.user_steve, self.user_bob)
+        key = cache_key("followers", self.user_bob.pk)
+        # Another worker is already recomputing bob's followers...
+        cache.add(f"{key}:lock", 1)
+
+        def other_worker_finishes(seconds):
+            cache.set(key, b"")
+
+        with mock.patch("friendship.models.sleep", side_effect=other_worker_finishes), self.assertNumQueries(0):
+            followers = Follow.objects.followers(self.user_bob)
+        # ...so this request used its (empty) result instead of querying
+        self.assertEqual(len(followers), 0)
+
+    @override_settings(FRIENDSHIP_CACHE_LOCK_TIMEOUT=0.01)
+    def test_waiters_fall_back_to_computing(self):
+        Follow.objects.add_follower(self.user_steve, self.user_bob)
+        cache.add(f"{cache_key('followers', self.user_bob.pk)}:lock", 1)
+
+        with self.assertNumQueries(1):
+            followers = Follow.objects.followers(self.user_bob)
+        self.assertEqual(followers, [self.user_steve])
+
+    def test_waiters_compute_once_the_lock_is_released(self):
+        Follow.objects.add_follower(self.user_steve, self.user_bob)
+        key = cache_key("followers", self.user_bob.pk)
+        cache.add(f"{key}:lock", 1)
+
+        def other_worker_gives_up(seconds):
+            cache.delete(f"{key}:lock")
+
+        with (
+            mock.patch("friendship.models.sleep", side_effect=other_worker_gives_up) as sleep,
+            self.assertNumQueries(1),
+        ):
+            followers = Follow.objects.followers(self.user_bob)
+        self.assertEqual(followers, [self.user_steve])
+        sleep.assert_called_once()
+
+    def test_batched_lookups_wait_for_the_lock_holder(self):
+        Friend.objects.add_friend(self.user_steve, self.user_bob).accept()
+        Friend.objects.friends(self.user_steve)
+        key = cache_key("friends", self.user_bob.pk)
+        cache.add(f"{key}:lock", 1)
+
+        def other_worker_finishes(seconds):
+            cache.set(key, b"")
+
+        # steve's friends are cached and bob's are being recomputed
+        with mock.patch("friendship.models.sleep", side_effect=other_worker_finishes), self.assertNumQueries(0):
+            self.assertEqual(Friend.objects.mutual_friend_count(self.user_steve, self.user_bob), 0)
+
+    def test_friends_of_friends_waits_for_the_lock_holder(self):
+        key = cache_key("friends_of_friends", self.user_bob.pk)
+        cache.add(f"{key}:lock", 1)
+
+        def other_worker_finishes(seconds):
+            cache.set(key, (b"", True))
+
+        with mock.patch("friendship.models.sleep", side_effect=other_worker_finishes), self.assertNumQueries(0):
+            self.assertEqual(len(Friend.objects.friends_of_friends(self.user_bob)), 0)
+
+    def test_pending_keys_are_computed_without_the_lock(self):
+        Follow.objects.followers(self.user_bob)
+        key = cache_key("followers", self.user_bob.pk)
+
+        with invalidation_buffer(), mock.patch("friendship.models.sleep") as sleep:
+            Follow.objects.add_follower(self.user_steve, self.user_bob)
+            # Another worker holds the lock, but it could not cache its result
+            cache.add(f"{key}:lock", 1)
+            self.assertEqual(Follow.objects.followers(self.user_bob), [self.user_steve])
+        sleep.assert_not_called()
+
+
+class InvalidationBufferTests(BaseTestCase):
+    def test_buffer_coalesces_busts(self):
+        Follow.objects.followers(self.user_amy)
+
+        with (
+            mock.patch.object(cache, "delete_many", wraps=cache.delete_many) as delete_many,
+            invalidation_buffer(),
+        ):
+            Follow.objects.add_follower(self.user_bob, self.user_amy)
+            Follow.objects.add_follower(self.user_steve, self.user_amy)
+            Block.objects.add_block(self.user_bob, self.user_susan)
+            # Busted keys read through to the database inside the buffer
+            self.assertEqual(len(Follow.objects.followers(self.user_amy)), 2)
+            delete_many.assert_not_called()
+
+        delete_many.assert_called_once()
+        self.assertIn(cache_key("followers", self.user_amy.pk), delete_many.call_args[0][0])
+        self.assertEqual(len(Follow.objects.followers(self.user_amy)), 2)
+
+    def test_busts_repeat_on_commit(self):
+        Follow.objects.followers(self.user_amy)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Follow.objects.add_follower(self.user_bob, self.user_amy)
+
+        # The suggestion refresh, the repeated bust and the counter adjustments
+        self.assertEqual(len(callbacks), 3)
+
+    @override_settings(
+        MIDDLEWARE=[
+            "django.contrib.sessions.middleware.SessionMiddleware",
+            "django.contrib.auth.middleware.AuthenticationMiddleware",
+            "friendship.middleware.InvalidationBufferMiddleware",
+        ]
+    )
+    def test_middleware(self):
+        url = reverse("follower_add", kwargs={"followee_username": self.user_amy.username})
+        with self.login(self.user_bob.username, self.user_pw):
+            with mock.patch.object(cache, "delete_many", wraps=cache.delete_many) as delete_many:
+                response = self.client.post(url)
+            self.assertResponse302(response)
+            delete_many.assert_called_once()
+        self.assertTrue(Follow.objects.follows(self.user_bob, self.user_amy))
+
+    def test_middleware_buffers_streaming_content(self):
+        def content():
+            Follow.objects.add_follower(self.user_bob, self.user_amy)
+            yield "followed\n"
+            Block.objects.add_block(self.user_bob, self.user_susan)
+            yield "blocked\n"
+
+        middleware = InvalidationBufferMiddleware(lambda request: StreamingHttpResponse(content()))
+        with mock.patch.object(cache, "delete_many", wraps=cache.delete_many) as delete_many:
+            response = middleware(RequestFactory().get("/"))
+            delete_many.assert_not_called()
+            self.assertEqual(b"".join(response.streaming_content), b"followed\nblocked\n")
+        delete_many.assert_called_once()
+
+
+@override_settings(FRIENDSHIP_CACHE_VERSIONING=True)
+class VersionedCacheTests(BaseTestCase):
+    def test_bust_bumps_one_generation(self):
+        Follow.objects.add_follower(self.user_bob, self.user_steve)
+        Follow.objects.followers(self.user_steve)
+        Follow.objects.followers_page(self.user_steve)
+        old_key = cache_key("followers_page", self.user_steve.pk)
+
+        with mock.patch.object(cache, "delete_many", wraps=cache.delete_many) as delete_many:
+            Follow.objects.add_follower(self.user_amy, self.user_steve)
+        delete_many.assert_called_once()
+        self.assertCountEqual(
+            delete_many.call_args[0][0],
+            [
+                f"fv-followers-{self.user_steve.pk}",
+                f"fv-following-{self.user_amy.pk}",
+                f"foc-{self.user_steve.pk}",
+                f"flc-{self.user_amy.pk}",
+            ],
+        )
+
+        # The derived keys are orphaned rather than deleted
+        self.assertIsNotNone(cache.get(old_key))
+        self.assertNotEqual(cache_key("followers_page", self.user_steve.pk), old_key)
+        self.assertEqual(len(Follow.objects.followers(self.user_steve)), 2)
+        self.assertEqual(len(Follow.objects.followers_page(self.user_steve).users), 2)
+
+    def test_shared_keys_follow_every_namespace(self):
+        Block.objects.add_block(self.user_bob, self.user_steve)
+        self.assertTrue(Block.objects.is_blocked(self.user_steve, self.user_bob))
+        Block.objects.remove_block(self.user_bob, self.user_steve)
+        self.assertFalse(Block.objects.is_blocked(self.user_steve, self.user_bob))
+
+
+class CacheSettingsTests(BaseTestCase):
+    @override_settings(
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "friendship": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "friendship"},
+        },
+        FRIENDSHIP_CACHE_ALIAS="friendship",
+    )
+    def test_cache_alias(self):
+        Follow.objects.add_follower(self.user_bob, self.user_steve)
+        Follow.objects.followers(self.user_steve)
+        key = cache_key("followers", self.user_steve.pk)
+        self.assertIsNotNone(caches["friendship"].get(key))
+        self.assertIsNone(caches["default"].get(key))
+
+    @override_settings(FRIENDSHIP_CACHE_KEY_PREFIX="social:v2:")
+    def test_key_prefix(self):
+        Follow.objects.add_follower(self.user_bob, self.user_steve)
+        self.assertEqual(Follow.objects.followers(self.user_steve), [self.user_bob])
+        key = f"social:v2:fo-{self.user_steve.pk}"
+        self.assertEqual(cache_key("followers", self.user_steve.pk), key)
+        self.assertIsNotNone(cache.get(key))
+
+        Follow.objects.remove_follower(self.user_bob, self.user_steve)
+        self.assertIsNone(cache.get(key))
+
+    @override_settings(FRIENDSHIP_CACHE_TIMEOUT=600, FRIENDSHIP_CACHE_TIMEOUTS={"followers": 60})
+    def test_timeouts(self):
+        self.assertEqual(cache_timeout("followers"), 60)
+        self.assertEqual(cache_timeout("following"), 600)
+
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            Follow.objects.followers(self.user_steve)
+        cache_set.assert_called_once_with(cache_key("followers", self.user_steve.pk), mock.ANY, 60)
+
+
+class RequestCacheTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        Friend.objects.add_friend(self.user_bob, self.user_steve).accept()
+
+    def test_repeat_reads_are_memoized(self):
+        with request_cache():
+            with mock.patch.object(cache, "get", wraps=cache.get) as cache_get:
+                with self.assertNumQueries(2):
+                    self.assertEqual(list(Friend.objects.friends(self.user_bob)), [self.user_steve])
+                Friend.objects.friends(self.user_steve)
+                self.assertEqual(cache_get.call_count, 2)
+
+                with self.assertNumQueries(0):
+                    for _i in range(3):
+                        self.assertIn(self.user_steve, Friend.objects.friends(self.user_bob))
+                        self.assertTrue(Friend.objects.are_friends(self.user_bob, self.user_steve))
+            self.assertEqual(cache_get.call_count, 2)
+
+    def test_bust_evicts_memo(self):
+        with request_cache():
+            self.assertEqual(len(Friend.objects.friends(self.user_bob)), 1)
+            Friend.objects.remove_friend(self.user_bob, self.user_steve)
+            self.assertEqual(len(Friend.objects.friends(self.user_bob)), 0)
+            self.assertEqual(Friend.objects.friend_count(self.user_bob), 0)
+
+    def test_memo_ends_with_block(self):
+        with request_cache():
+            Friend.objects.friends(self.user_bob)
+        with mock.patch.object(cache, "get", wraps=cache.get) as cache_get:
+            Friend.objects.friends(self.user_bob)
+        cache_get.assert_called_once()
+
+    @override_settings(
+        MIDDLEWARE=[
+            "django.contrib.sessions.middleware.SessionMiddleware",
+            "django.contrib.auth.middleware.AuthenticationMiddleware",
+            "friendship.middleware.RequestCacheMiddleware",
+        ]
+    )
+    def test_middleware(self):
+        url = reverse("friendship_view_friends", kwargs={"username": self.user_bob.username})
+        with mock.patch("friendship.middleware.request_cache", wraps=request_cache) as memo:
+            self.assertResponse200(self.client.get(url))
+        memo.assert_called_once()
+
+
+class AsyncManagerTests(BaseTestCase):
+    @asynccontextmanager
+    async def execute_on_commit(self):
+        # Writes run in the thread that owns the test transaction's connection
+        context = self.captureOnCommitCallbacks(execute=True)
+        await sync_to_async(context.__enter__)()
+        try:
+            yield
+        finally:
+            await sync_to_async(context.__exit__)(None, None, None)
+
+    async def test_friends(self):
+        request = await Friend.objects.aadd_friend(self.user_bob, self.user_steve)
+        self.assertEqual(await Friend.objects.aunread_request_count(self.user_steve), 1)
+        self.assertEqual([r async for r in await Friend.objects.arequests(self.user_steve)], [request])
+        self.assertEqual(await Friend.objects.asent_requests(self.user_bob), [request])
+        self.assertTrue(await Friend.objects.arequest_exists(self.user_steve, self.user_bob))
+        self.assertFalse(await Friend.objects.aare_friends(self.user_bob, self.user_steve))
+
+        async with self.execute_on_commit():
+            await request.aaccept()
+        friends = await Friend.objects.afriends(self.user_bob)
+        self.assertEqual([user async for user in friends], [self.user_steve])
+        self.assertEqual(await Friend.objects.afriend_count(self.user_bob), 1)
+        self.assertTrue(await Friend.objects.aare_friends(self.user_bob, self.user_steve))
+        self.assertEqual(len((await Friend.objects.afriends_page(self.user_steve)).users), 1)
+
+        async with self.execute_on_commit():
+            self.assertTrue(await Friend.objects.aremove_friend(self.user_bob, self.user_steve))
+        self.assertFalse(await Friend.objects.aare_friends(self.user_bob, self.user_steve))
+        self.assertEqual(await Friend.objects.afriend_count(self.user_bob), 0)
+
+    async def test_follows(self):
+        await Follow.objects.aadd_follower(self.user_bob, self.user_steve)
+        followers = await Follow.objects.afollowers(self.user_steve)
+        self.assertIn(self.user_bob, followers)
+        self.assertEqual([user async for user in await Follow.objects.afollowing(self.user_bob)], [self.user_steve])
+        self.assertEqual(await Follow.objects.afollower_count(self.user_steve), 1)
+        self.assertTrue(await Follow.objects.afollows(self.user_bob, self.user_steve))
+
+        self.assertTrue(await Follow.objects.aremove_follower(self.user_bob, self.user_steve))
+        self.assertFalse(await Follow.objects.afollows(self.user_bob, self.user_steve))
+        self.assertEqual(await Follow.objects.afollowing_count(self.user_bob), 0)
+
+    async def test_blocks(self):
+        await Block.objects.aadd_block(self.user_bob, self.user_steve)
+        self.assertTrue(await Block.objects.ais_blocked(self.user_steve, self.user_bob))
+        self.assertIn(self.user_steve, await Block.objects.ablocking(self.user_bob))
+        self.assertIn(self.user_bob, await Block.objects.ablocked(self.user_steve))
+        self.assertEqual(await Block.objects.ablocked_count(self.user_steve), 1)
+
+        await Block.objects.aremove_block(self.user_bob, self.user_steve)
+        self.assertFalse(await Block.objects.ais_blocked(self.user_steve, self.user_bob))
+
+    async def test_mutual_friends(self):
+        await Friend.objects.aimport_friendships([(self.user_bob, self.user_steve), (self.user_amy, self.user_steve)])
+        self.assertEqual(await Friend.objects.amutual_friend_count(self.user_bob, self.user_amy), 1)
+        self.assertEqual(
+            list((await Friend.objects.amutual_friends(self.user_bob, self.user_amy)).ids), [self.user_steve.pk]
+        )
+        self.assertEqual(list((await Friend.objects.afriends_of_friends(self.user_bob)).ids), [self.user_amy.pk])
+
+    async def test_rankings_use_the_async_orm(self):
+        await Friend.objects.aimport_friendships([(self.user_bob, self.user_steve), (self.user_amy, self.user_steve)])
+        with mock.patch("friendship.models.sync_to_async", side_effect=AssertionError("sync_to_async called")):
+            friends_of_friends = await Friend.objects.afriends_of_friends(self.user_bob)
+            suggestions = await Friend.objects.asuggestions(self.user_bob)
+        self.assertEqual(list(friends_of_friends.ids), [self.user_amy.pk])
+        self.assertEqual(list(suggestions.ids), [self.user_amy.pk])
+
+    def test_shares_sync_cache(self):
+        Follow.objects.add_follower(self.user_bob, self.user_steve)
+        async_to_sync(Follow.objects.afollowers)(self.user_steve)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(Follow.objects.followers(self.user_steve)), 1)
+
+
+class SuggestionTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user_joe = self.create_user("joe", "joe@joe.com", self.user_pw)
+        # amy shares two friends with bob, susan one and joe is followed by
+        # someone bob follows
+        Friend.objects.import_friendships(
+            [
+                (self.user_bob, self.user_steve),
+                (self.user_bob, self.user_susan),
+                (self.user_amy, self.user_steve),
+                (self.user_amy, self.user_susan),
+                (self.user_susan, self.user_steve),
+            ]
+        )
+        Follow.objects.add_follower(self.user_bob, self.user_steve)
+        Follow.objects.add_follower(self.user_steve, self.user_joe)
+
+    def test_ranking(self):
+        self.assertEqual(list(Friend.objects.suggestions(self.user_bob)), [self.user_amy, self.user_joe])
+        self.assertEqual(list(Friend.objects.suggestions(self.user_bob, limit=1).ids), [self.user_amy.pk])
+
+    def test_exclusions(self):
+        Friend.objects.add_friend(self.user_bob, self.user_amy)
+        Block.objects.add_block(self.user_joe, self.user_bob)
+        self.assertEqual(list(Friend.objects.suggestions(self.user_bob)), [])
+
+    def test_refresh_in_batches(self):
+        with self.assertNumQueries(10):
+            self.assertEqual(Friend.objects.refresh_suggestions([self.user_bob, self.user_amy, self.user_joe], 2), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(list(Friend.objects.suggestions(self.user_bob).ids), [self.user_amy.pk, self.user_joe.pk])
+            self.assertEqual(list(Friend.objects.suggestions(self.user_amy).ids), [self.user_bob.pk])
+
+    def test_refresh_on_commit(self):
+        Friend.objects.refresh_suggestions([self.user_bob, self.user_amy, self.user_steve])
+
+        # Until the change commits the previous ranking is served
+        with self.captureOnCommitCallbacks() as callbacks:
+            Friend.objects.remove_friend(self.user_amy, self.user_susan)
+        self.assertEqual(list(Friend.objects.suggestions(self.user_bob).ids), [self.user_amy.pk, self.user_joe.pk])
+
+        # Only the users involved with cached suggestions are then recomputed
+        with self.assertNumQueries(5):
+            for callback in callbacks:
+                callback()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                list(Friend.objects.suggestions(self.user_amy).ids), [self.user_bob.pk, self.user_susan.pk]
+            )
+        self.assertIsNone(cache.get(cache_key("suggestions", self.user_susan.pk)))
+
+        # Their friends are left alone, and so is anyone without cached
+        # suggestions
+        cache.set(cache_key("suggestions", self.user_bob.pk), b"")
+        with self.captureOnCommitCallbacks() as callbacks:
+            Friend.objects.add_friend(self.user_joe, self.user_susan).accept()
+        with self.assertNumQueries(0):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(cache.get(cache_key("suggestions", self.user_bob.pk)), b"")
+
+        # Following someone refreshes the follower
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.add_follower(self.user_bob, self.user_joe)
+        self.assertEqual(list(Friend.objects.suggestions(self.user_bob).ids), [self.user_joe.pk, self.user_amy.pk])
+
+    def test_management_command(self):
+        out = StringIO()
+        call_command("refresh_friend_suggestions", "--batch-size=2", stdout=out)
+        self.assertIn("Refreshed suggestions for 5 users", out.getvalue())
+        self.assertIsNotNone(cache.get(cache_key("suggestions", self.user_bob.pk)))
+
+        call_command("refresh_friend_suggestions", str(self.user_amy.pk), stdout=out)
+        self.assertIn("Refreshed suggestions for 1 users", out.getvalue())
+
+
+class GraphSnapshotTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        Friend.objects.import_friendships([(self.user_bob, self.user_steve), (self.user_amy, self.user_bob)])
+        Follow.objects.add_followers_many([(self.user_bob, self.user_susan), (self.user_steve, self.user_susan)])
+        Block.objects.add_block(self.user_susan, self.user_amy)
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def edges(self):
+        return {
+            "friends": set(Friend.objects.values_list("to_user_id", "from_user_id")),
+            "follows": set(Follow.objects.values_list("follower_id", "followee_id")),
+            "blocks": set(Block.objects.values_list("blocker_id", "blocked_id")),
+        }
+
+    def test_round_trip(self):
+        edges = self.edges()
+        out = StringIO()
+        call_command("export_friendship_graph", self.path, "--chunk-size=2", stdout=out)
+        self.assertIn("Exported 4 friends edges from 3 users", out.getvalue())
+
+        with read_snapshot(self.path) as snapshot:
+            follows = snapshot["follows"]
+            self.assertEqual(list(follows.nodes), sorted([self.user_bob.pk, self.user_steve.pk]))
+            self.assertEqual(list(follows.indptr), [0, 1, 2])
+            self.assertEqual(list(follows.indices), [self.user_susan.pk, self.user_susan.pk])
+        if isinstance(follows.nodes, memoryview):
+            # The files are unmapped once the snapshot is closed
+            with self.assertRaises(ValueError):
+                follows.nodes[0]
+
+        self.assertEqual(len(Follow.objects.followers(self.user_susan)), 2)
+        Friend.objects.all().delete()
+        Follow.objects.all().delete()
+        Block.objects.all().delete()
+
+        call_command("import_friendship_graph", self.path, "--batch-size=1", stdout=out)
+        self.assertIn("Imported 4 friends rows", out.getvalue())
+        self.assertEqual(self.edges(), edges)
+        self.assertEqual(len(Follow.objects.followers(self.user_susan)), 2)
+
+        # Importing again creates nothing
+        out = StringIO()
+        call_command("import_friendship_graph", self.path, stdout=out)
+        self.assertEqual(
+            out.getvalue().split("\n")[:3],
+            ["Imported 0 friends rows", "Imported 0 follows rows", "Imported 0 blocks rows"],
+        )
+
+    def test_invalid_snapshot(self):
+        with self.assertRaises(CommandError):
+            call_command("import_friendship_graph", self.path)
+
+    def test_import_database_error(self):
+        call_command("export_friendship_graph", self.path, stdout=StringIO())
+        with (
+            mock.patch.object(Follow.objects, "add_followers_many", side_effect=IntegrityError("boom")),
+            self.assertRaises(CommandError),
+        ):
+            call_command("import_friendship_graph", self.path, stdout=StringIO())
+
+
+@override_settings(FRIENDSHIP_UNDIRECTED_STORAGE=True)
+class UndirectedStorageTests(BaseTestCase):
+    def rows(self):
+        return set(Friend.objects.values_list("from_user_id", "to_user_id"))
+
+    def test_accept_stores_one_row(self):
+        Friend.objects.add_friend(self.user_steve, self.user_bob).accept()
+        self.assertEqual(self.rows(), {(self.user_bob.pk, self.user_steve.pk)})
+        self.assertTrue(Friend.objects.are_friends(self.user_bob, self.user_steve))
+        self.assertTrue(Friend.objects.are_friends(self.user_steve, self.user_bob))
+        self.assertEqual(Friend.objects.friends(self.user_bob), [self.user_steve])
+        self.assertEqual(Friend.objects.friends(self.user_steve), [self.user_bob])
+        self.assertEqual(Friend.objects.friend_count(self.user_steve), 1)
+
+        self.assertTrue(Friend.objects.remove_friend(self.user_bob, self.user_steve))
+        self.assertEqual(self.rows(), set())
+        self.assertEqual(Friend.objects.friends(self.user_steve), [])
+
+    def test_queries(self):
+        Friend.objects.import_friendships(
+            [(self.user_steve, self.user_bob), (self.user_bob, self.user_susan), (self.user_amy, self.user_susan)]
+        )
+        self.assertEqual(len(self.rows()), 3)
+        self.assertEqual(Friend.objects.friend_count(self.user_bob), 2)
+        first, cursor = Friend.objects.friends_page(self.user_bob, limit=1)
+        rest, cursor = Friend.objects.friends_page(self.user_bob, cursor=cursor)
+        self.assertEqual(list(first) + list(rest), [self.user_susan, self.user_steve])
+        self.assertIsNone(cursor)
+        self.assertEqual(Friend.objects.mutual_friends(self.user_bob, self.user_amy), [self.user_susan])
+        self.assertEqual(list(Friend.objects.friends_of_friends(self.user_bob)), [self.user_amy])
+        self.assertEqual(list(Friend.objects.suggestions(self.user_steve)), [self.user_susan])
+
+    def test_convert_storage(self):
+        with override_settings(FRIENDSHIP_UNDIRECTED_STORAGE=False):
+            Friend.objects.import_friendships([(self.user_steve, self.user_bob), (self.user_susan, self.user_amy)])
+        # A half-converted pair is only flipped
+        Friend.objects.filter(from_user=self.user_susan, to_user=self.user_amy).delete()
+        mirrored = self.rows() | {(self.user_susan.pk, self.user_amy.pk)}
+
+        out = StringIO()
+        # One short transaction per row, then an empty batch
+        with self.assertNumQueries(11):
+            call_command("convert_friend_storage", "undirected", "--batch-size=1", stdout=out)
+        self.assertIn("Deleted 1 mirrored rows and flipped 1 rows", out.getvalue())
+        self.assertEqual(self.rows(), {(self.user_bob.pk, self.user_steve.pk), (self.user_susan.pk, self.user_amy.pk)})
+        self.assertEqual(Friend.objects.friends(self.user_amy), [self.user_susan])
+
+        call_command("convert_friend_storage", "mirrored", "--batch-size=1", stdout=out)
+        self.assertIn("Inserted 2 mirrored rows", out.getvalue())
+        self.assertEqual(self.rows(), mirrored)
+
+
+@skipUnless(connection.vendor == "sqlite", "Query plans are checked against SQLite")
+class IndexUsageTests(BaseTestCase):
+    def assertUsesIndex(self, qs, index):
+        plan = qs.explain()
+        self.assertIn(f"INDEX {index} ", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_id_sets(self):
+        user = self.user_bob
+        self.assertUsesIndex(
+            Friend.objects.filter(to_user=user).values_list("from_user_id"), "friend_to_user_from_user_idx"
+        )
+        self.assertUsesIndex(
+            Follow.objects.filter(followee=user).values_list("follower_id"), "follow_followee_follower_idx"
+        )
+        self.assertUsesIndex(Block.objects.filter(blocked=user).values_list("blocker_id"), "block_blocked_blocker_idx")
+
+    def test_pages(self):
+        for qs, index in (
+            (Friend.objects.filter(to_user=self.user_bob), "friend_to_user_created_idx"),
+            (Follow.objects.filter(followee=self.user_bob), "follow_followee_created_idx"),
+            (Follow.objects.filter(follower=self.user_bob), "follow_follower_created_idx"),
+        ):
+            with self.subTest(index=index):
+                self.assertUsesIndex(qs.order_by("-created", "-pk").values_list("pk", "created")[:51], index)
+
+    def test_requests(self):
+        inbox = FriendshipRequest.objects.filter(to_user=self.user_bob).order_by("pk")
+        self.assertUsesIndex(inbox.values_list("pk", "from_user_id", "viewed"), "request_to_user_id_idx")
+        pending = FriendshipRequest.objects.filter(
+            Q(from_user__in=[self.user_bob]) | Q(to_user__in=[self.user_bob]), rejected__isnull=True
+        )
+        self.assertUsesIndex(pending.values_list("from_user_id", "to_user_id"), "request_to_user_rejected_idx")
+
+
+class BenchmarkTests(BaseTestCase):
+    def test_management_command(self):
+        users = User.objects.count()
+        out = StringIO()
+        with mock.patch.object(cache, "incr", wraps=cache.incr) as incr:
+            call_command("benchmark_friendship", "--users=20", "--degree=4", "--iterations=2", "--json", stdout=out)
+        results = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(results), 16)
+        self.assertEqual(results[0]["name"], "friends")
+        self.assertEqual(results[1]["cache_state"], "warm")
+        # The warm cache answers membership checks without queries
+        are_friends = [r for r in results if r["name"] == "are_friends"]
+        self.assertEqual([r["queries"] for r in are_friends], [1, 0])
+        # Writes are measured with the callbacks they run on commit, such as
+        # the two counter adjustments of each accept
+        self.assertEqual(incr.call_count, 4)
+        # The generated graph is rolled back
+        self.assertEqual(User.objects.count(), users)
+
+
+@override_settings(
+    FRIENDSHIP_CACHE_VERSIONING=False,
+    FRIENDSHIP_UNDIRECTED_STORAGE=False,
+    FRIENDSHIP_MANAGER_FRIENDSHIP_REQUEST_SELECT_RELATED_STRATEGY="select_related",
+)
+class BudgetTests(FriendshipTestMixin, BaseTestCase):
+    """
+    Pin the SQL queries and friendship cache calls of each public API, with a
+    cold cache and once every read has been cached. Lower a budget when an
+    optimization lands; never raise one without a reason.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user_joe = self.create_user("joe", "joe@joe.com", self.user_pw)
+        with self.captureOnCommitCallbacks(execute=True):
+            Friend.objects.import_friendships([(self.user_bob, self.user_steve), (self.user_steve, self.user_amy)])
+            self.susan_request_id = Friend.objects.add_friend(self.user_susan, self.user_bob).pk
+            self.amy_request_id = Friend.objects.add_friend(self.user_amy, self.user_bob).pk
+            Follow.objects.add_follower(self.user_bob, self.user_susan)
+            Follow.objects.add_follower(self.user_steve, self.user_bob)
+            Block.objects.add_block(self.user_amy, self.user_joe)
+        # Measure from the state a later request finds, once these committed
+        connection.run_on_commit.clear()
+
+    def get(self, view, *args, strategy="select_related"):
+        request = RequestFactory().get("/")
+        request.user = self.user_bob
+        with override_settings(FRIENDSHIP_MANAGER_FRIENDSHIP_REQUEST_SELECT_RELATED_STRATEGY=strategy):
+            return view(request, *args).content
+
+    def aget(self, view, *args, strategy="select_related"):
+        return self.get(async_to_sync(view), *args, strategy=strategy)
+
+    def run_async(self, method, *args, fetch=lambda result: result):
+        """Return a callable that runs the async ``method`` to completion,
+        iterating the lazy list ``fetch`` picks out of its result"""
+
+        async def run():
+            result = fetch(await method(*args))
+            if isinstance(result, LazyModelList):
+                return [obj async for obj in result]
+            return result
+
+        return async_to_sync(run)
+
+    def reads(self):
+        bob, steve, susan, amy = self.user_bob, self.user_steve, self.user_susan, self.user_amy
+        return {
+            "friends": lambda: list(Friend.objects.friends(bob)),
+            "friend_count": lambda: Friend.objects.friend_count(bob),
+            "friends_page": lambda: list(Friend.objects.friends_page(bob).users),
+            "are_friends": lambda: Friend.objects.are_friends(bob, steve),
+            "mutual_friends": lambda: list(Friend.objects.mutual_friends(bob, amy)),
+            "friends_of_friends": lambda: list(Friend.objects.friends_of_friends(bob)),
+            "suggestions": lambda: list(Friend.objects.suggestions(bob)),
+            "requests": lambda: [(r.from_user, r.to_user) for r in Friend.objects.requests(bob)],
+            "sent_requests": lambda: [(r.from_user, r.to_user) for r in Friend.objects.sent_requests(susan)],
+            "unread_request_count": lambda: Friend.objects.unread_request_count(bob),
+            "request_exists": lambda: Friend.objects.request_exists(bob, susan),
+            "followers": lambda: list(Follow.objects.followers(bob)),
+            "following": lambda: list(Follow.objects.following(bob)),
+            "follower_count": lambda: Follow.objects.follower_count(bob),
+            "follows": lambda: Follow.objects.follows(bob, susan),
+            "blocked": lambda: list(Block.objects.blocked(self.user_joe)),
+            "blocking": lambda: list(Block.objects.blocking(amy)),
+            "is_blocked": lambda: Block.objects.is_blocked(bob, amy),
+            "relationship_status_many": lambda: relationship_status_many(bob, [steve, susan, amy]),
+            "view_friends": lambda: self.get(views.view_friends, "bob"),
+            "view_followers": lambda: self.get(views.followers, "bob"),
+            "view_following": lambda: self.get(views.following, "bob"),
+            "view_requests": lambda: self.get(views.friendship_request_list),
+            "view_requests_prefetch": lambda: self.get(views.friendship_request_list, strategy="prefetch_related"),
+            "view_request_detail": lambda: self.get(views.friendship_requests_detail, self.susan_request_id),
+        }
+
+    def async_reads(self):
+        bob, steve, susan, amy = self.user_bob, self.user_steve, self.user_susan, self.user_amy
+        return {
+            "afriends": self.run_async(Friend.objects.afriends, bob),
+            "afriend_count": self.run_async(Friend.objects.afriend_count, bob),
+            "afriends_page": self.run_async(Friend.objects.afriends_page, bob, fetch=lambda page: page.users),
+            "aare_friends": self.run_async(Friend.objects.aare_friends, bob, steve),
+            "amutual_friends": self.run_async(Friend.objects.amutual_friends, bob, amy),
+            "afriends_of_friends": self.run_async(Friend.objects.afriends_of_friends, bob),
+            "asuggestions": self.run_async(Friend.objects.asuggestions, bob),
+            "arequests": self.run_async(Friend.objects.arequests, bob),
+            "asent_requests": self.run_async(Friend.objects.asent_requests, susan),
+            "aunread_request_count": self.run_async(Friend.objects.aunread_request_count, bob),
+            "arequest_exists": self.run_async(Friend.objects.arequest_exists, bob, susan),
+            "afollowers": self.run_async(Follow.objects.afollowers, bob),
+            "afollowing": self.run_async(Follow.objects.afollowing, bob),
+            "afollower_count": self.run_async(Follow.objects.afollower_count, bob),
+            "afollows": self.run_async(Follow.objects.afollows, bob, susan),
+            "ablocked": self.run_async(Block.objects.ablocked, self.user_joe),
+            "ablocking": self.run_async(Block.objects.ablocking, amy),
+            "ais_blocked": self.run_async(Block.objects.ais_blocked, bob, amy),
+            "async_view_friends": lambda: self.aget(async_views.view_friends, "bob"),
+            "async_view_followers": lambda: self.aget(async_views.followers, "bob"),
+            "async_view_following": lambda: self.aget(async_views.following, "bob"),
+            "async_view_requests": lambda: self.aget(async_views.friendship_request_list),
+            "async_view_request_detail": lambda: self.aget(
+                async_views.friendship_requests_detail, self.susan_request_id
+            ),
+        }
+
+    def writes(self):
+        bob, steve, susan, amy, joe = self.user_bob, self.user_steve, self.user_susan, self.user_amy, self.user_joe
+        susan_request = FriendshipRequest.objects.get(pk=self.susan_request_id)
+        amy_request = FriendshipRequest.objects.get(pk=self.amy_request_id)
+        return {
+            "add_friend": lambda: Friend.objects.add_friend(bob, joe),
+            "accept": susan_request.accept,
+            "reject": amy_request.reject,
+            "cancel": amy_request.cancel,
+            "remove_friend": lambda: Friend.objects.remove_friend(bob, steve),
+            "add_follower": lambda: Follow.objects.add_follower(bob, joe),
+            "remove_follower": lambda: Follow.objects.remove_follower(bob, susan),
+            "add_block": lambda: Block.objects.add_block(bob, joe),
+            "remove_block": lambda: Block.objects.remove_block(amy, joe),
+        }
+
+    def async_writes(self):
+        bob, steve, susan, amy, joe = self.user_bob, self.user_steve, self.user_susan, self.user_amy, self.user_joe
+        susan_request = FriendshipRequest.objects.get(pk=self.susan_request_id)
+        amy_request = FriendshipRequest.objects.get(pk=self.amy_request_id)
+        return {
+            "aadd_friend": self.run_async(Friend.objects.aadd_friend, bob, joe),
+            "aaccept": self.run_async(susan_request.aaccept),
+            "areject": self.run_async(amy_request.areject),
+            "acancel": self.run_async(amy_request.acancel),
+            "aremove_friend": self.run_async(Friend.objects.aremove_friend, bob, steve),
+            "aadd_follower": self.run_async(Follow.objects.aadd_follower, bob, joe),
+            "aremove_follower": self.run_async(Follow.objects.aremove_follower, bob, susan),
+            "aadd_block": self.run_async(Block.objects.aadd_block, bob, joe),
+            "aremove_block": self.run_async(Block.objects.aremove_block, amy, joe),
+        }
+
+    # name: (cold queries, cold cache calls, warm queries, warm cache calls)
+    def budgets(self):
+        return {
+            "friends": (2, 4, 1, 1),
+            "friend_count": (1, 2, 0, 1),
+            "friends_page": (2, 4, 1, 1),
+            "are_friends": (1, 1, 0, 1),
+            "mutual_friends": (3, 7, 1, 1),
+            "friends_of_friends": (2, 4, 1, 1),
+            "suggestions": (5, 4, 0, 1),
+            "requests": (2, 4, 1, 1),
+            "sent_requests": (1, 4, 0, 1),
+            "unread_request_count": (1, 4, 0, 1),
+            "request_exists": (1, 0, 1, 0),
+            "followers": (2, 4, 1, 1),
+            "following": (2, 4, 1, 1),
+            "follower_count": (1, 2, 0, 1),
+            "follows": (1, 1, 0, 1),
+            "blocked": (2, 4, 1, 1),
+            "blocking": (2, 4, 1, 1),
+            "is_blocked": (1, 5, 0, 1),
+            "relationship_status_many": (6, 1, 3, 1),
+            "view_friends": (3, 4, 2, 1),
+            "view_followers": (3, 4, 2, 1),
+            "view_following": (3, 4, 2, 1),
+            "view_requests": (2, 4, 1, 1),
+            "view_requests_prefetch": (4, 4, 3, 1),
+            "view_request_detail": (1, 0, 1, 0),
+            "add_friend": (7, 4, 11, 5),
+            "accept": (6, 7, 11, 8),
+            "reject": (3, 3, 8, 4),
+            "cancel": (3, 3, 8, 4),
+            "remove_friend": (2, 7, 7, 8),
+            "add_follower": (4, 7, 9, 8),
+            "remove_follower": (4, 7, 9, 8),
+            "add_block": (4, 7, 9, 8),
+            "remove_block": (4, 7, 4, 7),
+        }
+
+    def async_budgets(self):
+        # The async twins cost the same as the sync methods and views
+        budgets = self.budgets()
+        return {
+            name: budgets[name.removeprefix("async_") if name.startswith("async_") else name[1:]]
+            for name in {**self.async_reads(), **self.async_writes()}
+        }
+
+    def assertBudgets(self, operations, budgets):
+        self.assertEqual(operations().keys(), budgets.keys())
+        for name, (cold_queries, cold_calls, warm_queries, warm_calls) in budgets.items():
+            for state, queries, cache_calls in (("cold", cold_queries, cold_calls), ("warm", warm_queries, warm_calls)):
+                with self.subTest(name=name, state=state), transaction.atomic():
+                    calls = operations()
+                    cache.clear()
+                    if state == "warm":
+                        for read in self.reads().values():
+                            read()
+                    with (
+                        self.assertNumQueries(queries),
+                        self.assertNumCacheCalls(cache_calls),
+                        self.captureOnCommitCallbacks(execute=True),
+                    ):
+                        calls[name]()
+                    transaction.set_rollback(True)
+        cache.clear()
+
+    def test_budgets(self):
+        self.assertBudgets(lambda: {**self.reads(), **self.writes()}, self.budgets())
+
+    def test_async_budgets(self):
+        self.assertBudgets(lambda: {**self.async_reads(), **self.async_writes()}, self.async_budgets())
+
+
+@override_settings(FRIENDSHIP_CACHE_VERSIONING=True)
+class VersionedBudgetTests(BudgetTests):
+    """The budgets with ``FRIENDSHIP_CACHE_VERSIONING`` enabled"""
+
+    def budgets(self):
+        # Only the entries that differ: versioned keys cost generation lookups
+        return {
+            **super().budgets(),
+            "friends": (2, 6, 1, 2),
+            "friends_page": (2, 6, 1, 2),
+            "are_friends": (1, 4, 0, 2),
+            "mutual_friends": (3, 10, 1, 2),
+            "friends_of_friends": (2, 6, 1, 2),
+            "requests": (2, 6, 1, 2),
+            "sent_requests": (1, 6, 0, 2),
+            "unread_request_count": (1, 6, 0, 2),
+            "followers": (2, 6, 1, 2),
+            "following": (2, 6, 1, 2),
+            "follows": (1, 4, 0, 2),
+            "blocked": (2, 6, 1, 2),
+            "blocking": (2, 6, 1, 2),
+            "is_blocked": (1, 13, 0, 2),
+            "relationship_status_many": (6, 9, 3, 2),
+            "view_friends": (3, 6, 2, 2),
+            "view_followers": (3, 6, 2, 2),
+            "view_following": (3, 6, 2, 2),
+            "view_requests": (2, 6, 1, 2),
+            "view_requests_prefetch": (4, 6, 3, 2),
+            "add_friend": (7, 7, 11, 7),
+        }
+
+
+@override_settings(FRIENDSHIP_UNDIRECTED_STORAGE=True)
+class UndirectedBudgetTests(BudgetTests):
+    """The budgets with ``FRIENDSHIP_UNDIRECTED_STORAGE`` enabled"""
+
+    def budgets(self):
+        # Only the entries that differ from mirrored storage
+        return {
+            **super().budgets(),
+            "friends_of_friends": (3, 4, 1, 1),
+            "remove_friend": (2, 7, 6, 8),
+        }
+
+
+class MetricsTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.collector = MetricsCollector()
+        self.enterContext(override_settings(FRIENDSHIP_METRICS=self.collector))
+
+    def test_disabled_by_default(self):
+        with override_settings(FRIENDSHIP_METRICS=None):
+            Friend.objects.friends(self.user_bob)
+        self.assertEqual(self.collector.events, [])
+
+    def test_hook_is_imported_on_first_use(self):
+        with (
+            override_settings(FRIENDSHIP_METRICS="friendship.tests.tests.imported_collector"),
+            mock.patch("friendship.metrics.import_string", return_value=self.collector) as import_string,
+        ):
+            import_string.assert_not_called()
+            Friend.objects.friends(self.user_bob)
+            Friend.objects.friends(self.user_bob)
+        import_string.assert_called_once_with("friendship.tests.tests.imported_collector")
+        self.assertEqual(self.collector.total("friendship.cache.hit", cache_type="friends"), 1)
+
+    def test_cache_and_rows(self):
+        Friend.objects.add_friend(self.user_bob, self.user_steve).accept()
+        self.assertEqual(self.collector.total("friendship.cache.bust", cache_type="friends"), 2)
+        self.collector.clear()
+
+        self.assertEqual(list(Friend.objects.friends(self.user_bob)), [self.user_steve])
+        self.assertEqual(list(Friend.objects.friends(self.user_bob)), [self.user_steve])
+        self.assertEqual(self.collector.total("friendship.cache.miss", cache_type="friends"), 1)
+        self.assertEqual(self.collector.total("friendship.cache.hit", cache_type="friends"), 1)
+        self.assertEqual(self.collector.total("friendship.rows", model="auth.User"), 2)
+
+    def test_waiters_report_one_lookup(self):
+        Friend.objects.friends(self.user_bob)
+        key = cache_key("followers", self.user_bob.pk)
+        cache.add(f"{key}:lock", 1)
+        self.collector.clear()
+
+        with mock.patch("friendship.models.sleep", side_effect=lambda seconds: cache.set(key, b"")):
+            Follow.objects.followers(self.user_bob)
+        self.assertEqual(self.collector.total("friendship.cache.miss"), 1)
+
+    def test_latency(self):
+        Friend.objects.add_friend(self.user_bob, self.user_steve).accept()
+        async_to_sync(Follow.objects.afollowers)(self.user_bob)
+        async_to_sync(Friend.objects.amutual_friend_count)(self.user_bob, self.user_steve)
+        methods = [tags["method"] for name, value, tags in self.collector.events if name == "friendship.latency"]
+        # Public methods called by another one are part of its latency
+        self.assertEqual(
+            methods,
+            [
+                "FriendshipManager.add_friend",
+                "FriendshipRequest.accept",
+                "FollowingManager.afollowers",
+                "FriendshipManager.amutual_friend_count",
+            ],
+        )
+
 
 class UsernameFieldTests(BaseTestCase):
     """Views resolve users by USERNAME_FIELD, not a hardcoded 'username' (#57)."""
@@ -1,105 +1,96 @@
+from django.conf import settings
 from django.urls import path
 
-from friendship.views import (
-    all_users,
-    block_add,
-    block_remove,
-    blockers,
-    blocking,
-    follower_add,
-    follower_remove,
-    followers,
-    following,
-    friendship_accept,
-    friendship_add_friend,
-    friendship_cancel,
-    friendship_reject,
-    friendship_request_list,
-    friendship_request_list_rejected,
-    friendship_requests_detail,
-    view_friends,
-)
+if getattr(settings, "FRIENDSHIP_ASYNC_VIEWS", False):
+    from friendship import async_views as views
+else:
+    from friendship import views
 
 urlpatterns = [
-    path("users/", view=all_users, name="friendship_view_users"),
+    path("users/", view=views.all_users, name="friendship_view_users"),
     path(
         "friends/<str:username>/",
-        view=view_friends,
+        view=views.view_friends,
         name="friendship_view_friends",
     ),
     path(
         "friend/add/<str:to_username>/",
-        view=friendship_add_friend,
+        view=views.friendship_add_friend,
         name="friendship_add_friend",
     ),
     path(
         "friend/accept/<int:friendship_request_id>/",
-        view=friendship_accept,
+        view=views.friendship_accept,
         name="friendship_accept",
     ),
     path(
         "friend/reject/<int:friendship_request_id>/",
-        view=friendship_reject,
+        view=views.friendship_reject,
         name="friendship_reject",
     ),
     path(
         "friend/cancel/<int:friendship_request_id>/",
-        view=friendship_cancel,
+        view=views.friendship_cancel,
         name="friendship_cancel",
     ),
     path(
         "friend/requests/",
-        view=friendship_request_list,
+        view=views.friendship_request_list,
         name="friendship_request_list",
     ),
     path(
         "friend/requests/rejected/",
-        view=friendship_request_list_rejected,
+        view=views.friendship_request_list_rejected,
         name="friendship_requests_rejected",
     ),
     path(
         "friend/request/<int:friendship_request_id>/",
-        view=friendship_requests_detail,
+        view=views.friendship_requests_detail,
         name="friendship_requests_detail",
     ),
     path(
         "followers/<str:username>/",
-        view=followers,
+        view=views.followers,
         name="friendship_followers",
     ),
     path(
         "following/<str:username>/",
-        view=following,
+        view=views.following,
         name="friendship_following",
     ),
     path(
         "follower/add/<str:followee_username>/",
-        view=follower_add,
+        view=views.follower_add,
         name="follower_add",
     ),
     path(
         "follower/remove/<str:followee_username>/",
-        view=follower_remove,
+        view=views.follower_remove,
         name="follower_remove",
     ),
     path(
         "blockers/<str:username>/",
-        view=blockers,
+        view=views.blockers,
         name="friendship_blockers",
     ),
     path(
         "blocking/<str:username>/",
-        view=blocking,
+        view=views.blocking,
         name="friendship_blocking",
     ),
     path(
         "block/add/<str:blocked_username>/",
-        view=block_add,
+        view=views.block_add,
         name="block_add",
     ),
     path(
         "block/remove/<str:blocked_username>/",
-        view=block_remove,
+        view=views.block_remove,
         name="block_remove",
     ),
+    path(
+        "export/<slug:kind>.<slug:format>",
+        view=views.export_relationships,
+        name="friendship_export",
+    ),
 ]
@@ -1,8 +1,10 @@
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 
 from friendship.exceptions import AlreadyExistsError
+from friendship.export import EXPORT_FORMATS, EXPORT_KINDS, export_lines
 from friendship.models import Block, Follow, Friend, FriendshipRequest
 
 try:
@@ -33,10 +35,25 @@ def _username_lookup(value):
     return {user_model.USERNAME_FIELD: value}
 
 
+def _relationship_list(request, user, full, paged):
+    """Return ``(users, next_cursor)`` for one of the relationship list views.
+
+    With ``FRIENDSHIP_PAGINATE_VIEWS`` enabled only one keyset page is loaded,
+    starting from the ``cursor`` query parameter. Otherwise the full list is
+    returned and ``next_cursor`` is ``None``.
+    """
+    if not getattr(settings, "FRIENDSHIP_PAGINATE_VIEWS", False):
+        return full(user), None
+    try:
+        return paged(user, cursor=request.GET.get("cursor"))
+    except ValueError:
+        raise Http404("Invalid cursor") from None
+
+
 def view_friends(request, username, template_name="friendship/friend/user_list.html"):
     """View the friends of a user"""
     user = get_object_or_404(user_model, **_username_lookup(username))
-    friends = Friend.objects.friends(user)
+    friends, next_cursor = _relationship_list(request, user, Friend.objects.friends, Friend.objects.friends_page)
     return render(
         request,
         template_name,
@@ -44,6 +61,7 @@ def view_friends(request, username, template_name="friendship/friend/user_list.h
             get_friendship_context_object_name(): user,
             "friendship_context_object_name": get_friendship_context_object_name(),
             "friends": friends,
+            "next_cursor": next_cursor,
         },
     )
 
@@ -121,7 +139,8 @@ def friendship_request_list_rejected(request, template_name="friendship/friend/r
 @login_required
 def friendship_requests_detail(request, friendship_request_id, template_name="friendship/friend/request.html"):
     """View a particular friendship request"""
-    f_request = get_object_or_404(FriendshipRequest, id=friendship_request_id)
+    qs = FriendshipRequest.objects.select_related("from_user", "to_user")
+    f_request = get_object_or_404(qs, id=friendship_request_id)
 
     return render(request, template_name, {"friendship_request": f_request})
 
@@ -129,7 +148,7 @@ def friendship_requests_detail(request, friendship_request_id, template_name="fr
 def followers(request, username, template_name="friendship/follow/followers_list.html"):
     """List this user's followers"""
     user = get_object_or_404(user_model, **_username_lookup(username))
-    followers = Follow.objects.followers(user)
+    followers, next_cursor = _relationship_list(request, user, Follow.objects.followers, Follow.objects.followers_page)
     return render(
         request,
         template_name,
@@ -137,6 +156,7 @@ def followers(request, username, template_name="friendship/follow/followers_list
             get_friendship_context_object_name(): user,
             "friendship_context_object_name": get_friendship_context_object_name(),
             "followers": followers,
+            "next_cursor": next_cursor,
         },
     )
 
@@ -144,7 +164,7 @@ def followers(request, username, template_name="friendship/follow/followers_list
 def following(request, username, template_name="friendship/follow/following_list.html"):
     """List who this user follows"""
     user = get_object_or_404(user_model, **_username_lookup(username))
-    following = Follow.objects.following(user)
+    following, next_cursor = _relationship_list(request, user, Follow.objects.following, Follow.objects.following_page)
     return render(
         request,
         template_name,
@@ -152,6 +172,7 @@ def following(request, username, template_name="friendship/follow/following_list
             get_friendship_context_object_name(): user,
             "friendship_context_object_name": get_friendship_context_object_name(),
             "following": following,
+            "next_cursor": next_cursor,
         },
     )
 
@@ -250,3 +271,14 @@ def block_remove(request, blocked_username, template_name="friendship/block/remo
         return redirect("friendship_blocking", username=blocker.get_username())
 
     return render(request, template_name, {"blocked_username": blocked_username})
+
+
+@login_required
+def export_relationships(request, kind, format):
+    """Stream the logged-in user's friends, followers, following, blocks or
+    requests as CSV or JSON lines"""
+    if kind not in EXPORT_KINDS or format not in EXPORT_FORMATS:
+        raise Http404("No such export")
+    response = StreamingHttpResponse(export_lines(kind, request.user, format), content_type=EXPORT_FORMATS[format])
+    response["Content-Disposition"] = f'attachment; filename="{kind}.{format}"'
+    return response